@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import FrozenSet, Optional
+
+import numpy as np
+
+from bm25 import tokenize
+
+# === Configuration ===
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.92))  # Min cosine similarity for a hit
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))   # Across all documents
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 24 * 3600))
+
+
+class AnswerCache:
+    """
+    Semantic cache of answers to memory-independent questions, per document.
+
+    A question hits when its embedding is within ANSWER_CACHE_SIMILARITY
+    cosine similarity of a cached question about the same document and both
+    mention exactly the same numbers and identifiers, so "page 3" never
+    answers "page 4" and "clause 4.2" never answers "clause 4.3".
+    Entries are evicted least-recently-used first and expire after a TTL.
+    """
+
+    def __init__(
+        self,
+        similarity: float = ANSWER_CACHE_SIMILARITY,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = ANSWER_CACHE_TTL_SECONDS,
+    ):
+        self.similarity = similarity
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (doc_hash, question) -> (unit vector, identifiers, answer, created)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        array = np.asarray(vector, dtype="float32")
+        return array / max(float(np.linalg.norm(array)), 1e-12)
+
+    @staticmethod
+    def _identifiers(question: str) -> FrozenSet[str]:
+        # Embeddings barely separate "page 3" from "page 4"; compare these exactly
+        return frozenset(term for term in tokenize(question) if any(ch.isdigit() for ch in term))
+
+    def get(self, doc_hash: str, question: str, question_vector) -> Optional[str]:
+        """
+        Return a cached answer for a semantically equivalent question.
+
+        Args:
+            doc_hash (str): Content hash of the active document.
+            question (str): The new question.
+            question_vector (Sequence[float]): Embedding of the new question.
+
+        Returns:
+            str | None: Cached answer, or None on a miss.
+        """
+        if not doc_hash:
+            return None
+
+        query = self._unit(question_vector)
+        identifiers = self._identifiers(question)
+        now = time.time()
+        best_key, best_score = None, self.similarity
+
+        with self._lock:
+            for key, (vector, entry_identifiers, _, created) in list(self._entries.items()):
+                if now - created > self.ttl_seconds:
+                    del self._entries[key]
+                    continue
+                if key[0] != doc_hash or entry_identifiers != identifiers:
+                    continue
+                score = float(vector @ query)
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            print(f"[ANSWER CACHE] Hit (similarity {best_score:.3f}) for: {best_key[1]}")
+            return self._entries[best_key][2]
+
+    def put(self, doc_hash: str, question: str, question_vector, answer: str):
+        """
+        Store an answer for a memory-independent question.
+
+        Args:
+            doc_hash (str): Content hash of the active document.
+            question (str): Question text.
+            question_vector (Sequence[float]): Embedding of the question.
+            answer (str): Answer to cache.
+        """
+        if not doc_hash or not answer:
+            return
+
+        with self._lock:
+            key = (doc_hash, question)
+            self._entries[key] = (self._unit(question_vector), self._identifiers(question), answer, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, doc_hash: str = None):
+        """
+        Drop cached answers for one document, or for all documents.
+
+        Args:
+            doc_hash (str, optional): Content hash of the document to drop.
+        """
+        with self._lock:
+            if doc_hash is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == doc_hash]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        """
+        Return hit/miss counters and the current size.
+
+        Returns:
+            dict: Hits, misses, hit rate and number of entries.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+# === Singleton instance ===
+answer_cache = AnswerCache()
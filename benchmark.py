@@ -0,0 +1,379 @@
+"""
+Offline benchmark for ingestion and question answering.
+
+Generates synthetic digital and scanned PDFs, drives the FastAPI routes
+through the test client with a deterministic stand-in for the Ollama LLM,
+and writes results as JSON so runs can be compared against a baseline.
+
+Usage:
+    python benchmark.py --pages 5 20 50 --questions 20 --output bench.json
+    python benchmark.py --baseline bench.json --output bench_new.json
+    python benchmark.py --kinds digital --pages 20 --load-clients 1 2 4 8 --llm-slots 4
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import fitz  # PyMuPDF
+import numpy as np
+from fastapi.testclient import TestClient
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+import chatbot
+import document_cache
+import embedding_cache
+import summaries
+from answer_cache import answer_cache
+from llm_gateway import GatewayLLM, LLMGateway, LLM_MAX_CONCURRENCY
+from embeddings import chunk_text, get_embeddings, build_chunk_index
+from pdf_reader import iter_pages
+
+# === Configuration ===
+SEED = 1234
+WORDS = (
+    "contract clause payment invoice delivery warranty liability section schedule annex "
+    "party supplier customer termination notice period fee service level agreement audit "
+    "report revenue forecast quarter risk control compliance policy procedure manual part"
+).split()
+
+# Questions per intent path; a counter suffix keeps each one distinct
+QUESTIONS = {
+    "page stats": "How many pages does the document have? ({i})",
+    "page info": "What is on page {page}?",
+    "document content": "What does the document say about clause {i} payment terms?",
+    "summarization": "Summarize the document, focusing on item {i}.",
+    "memory": "What did I ask you before? ({i})",
+}
+
+
+class BenchmarkLLM(LLM):
+    """
+    Deterministic local stand-in for the Ollama LLM with configurable latency.
+
+    Classification prompts get fixed labels, agent prompts get an immediate
+    final answer, and everything else gets a fixed-length canned answer.
+    """
+
+    first_token_latency: float = 0.2   # Seconds before the first token (prefill)
+    token_latency: float = 0.01        # Seconds per generated token
+    answer_tokens: int = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "benchmark"
+
+    def _respond(self, prompt: str) -> str:
+        if "Classify the user's question" in prompt:
+            return "document content"
+        if "depend on past conversation context" in prompt:
+            return "no"
+        answer = " ".join(f"word{i}" for i in range(self.answer_tokens))
+        if "Thought:" in prompt or "Action:" in prompt:
+            return f"Thought: I know the answer.\nFinal Answer: {answer}"
+        return answer
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for i, token in enumerate(self._respond(prompt).split(" ")):
+            if i:
+                time.sleep(self.token_latency)
+                token = " " + token
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+            yield GenerationChunk(text=token)
+
+
+def make_pdf(path: str, pages: int, scanned: bool = False, dpi: int = 100):
+    """
+    Write a synthetic PDF with a numbered heading and filler text on each page.
+
+    Args:
+        path (str): Output file path.
+        pages (int): Number of pages.
+        scanned (bool): Rasterise each page so it has no embedded text.
+        dpi (int): Resolution used for scanned pages.
+    """
+    rng = random.Random(SEED + pages)
+    doc = fitz.open()
+    for page_number in range(1, pages + 1):
+        page = doc.new_page()
+        body = " ".join(rng.choice(WORDS) for _ in range(350))
+        text = f"Section {page_number}. Clause {page_number}.{rng.randint(1, 9)} Part AB-{1000 + page_number}\n\n{body}"
+        page.insert_textbox(fitz.Rect(50, 50, 545, 790), text, fontsize=10)
+    if scanned:
+        image_doc = fitz.open()
+        for page in doc:
+            pixmap = page.get_pixmap(dpi=dpi)
+            image_page = image_doc.new_page(width=page.rect.width, height=page.rect.height)
+            image_page.insert_image(image_page.rect, pixmap=pixmap)
+        doc = image_doc
+    doc.save(path)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """
+    Summarise latency samples.
+
+    Args:
+        samples (List[float]): Latencies in seconds.
+
+    Returns:
+        Dict[str, float]: Count, mean, p50, p95 and p99 in seconds.
+    """
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples)
+    return {
+        "count": len(samples),
+        "mean": round(float(values.mean()), 4),
+        "p50": round(float(np.percentile(values, 50)), 4),
+        "p95": round(float(np.percentile(values, 95)), 4),
+        "p99": round(float(np.percentile(values, 99)), 4),
+    }
+
+
+def bench_stages(path: str, pages: int, scanned: bool) -> Dict[str, float]:
+    """
+    Time each ingestion stage directly and report throughput in pages/sec.
+
+    Args:
+        path (str): PDF to process.
+        pages (int): Page count of the PDF.
+        scanned (bool): Whether the PDF is image-only (reported as OCR throughput).
+
+    Returns:
+        Dict[str, float]: Pages/sec per stage.
+    """
+    from document import ParsedDocument
+
+    result = {}
+    # The ingestion reader: scanned pages are OCR'd as they are read
+    start_time = time.perf_counter()
+    page_texts = [text for _, text in iter_pages(path)]
+    stage = "ocr_pages_per_sec" if scanned else "extract_pages_per_sec"
+    result[stage] = round(pages / (time.perf_counter() - start_time), 2)
+
+    document = ParsedDocument(os.path.basename(path), page_texts)
+    start_time = time.perf_counter()
+    chunks = chunk_text(document)
+    result["chunk_pages_per_sec"] = round(pages / (time.perf_counter() - start_time), 2)
+
+    start_time = time.perf_counter()
+    build_chunk_index(chunks, get_embeddings())
+    result["embed_index_pages_per_sec"] = round(pages / (time.perf_counter() - start_time), 2)
+
+    # Same chunks again: every vector comes from the embedding cache, as for an unchanged revision
+    start_time = time.perf_counter()
+    build_chunk_index(chunks, get_embeddings())
+    result["embed_index_cached_pages_per_sec"] = round(pages / (time.perf_counter() - start_time), 2)
+    result["chunks"] = len(chunks)
+    return result
+
+
+def upload(client: TestClient, path: str, session_id: str) -> Dict[str, Any]:
+    """
+    Upload a PDF through the API and wait for its ingestion job.
+
+    Returns:
+        Dict[str, Any]: Wall-clock seconds and the job result.
+    """
+    start_time = time.perf_counter()
+    with open(path, "rb") as f:
+        accepted = client.post(
+            "/upload/", params={"session_id": session_id},
+            files={"file": (os.path.basename(path), f, "application/pdf")},
+        ).json()
+    while True:
+        job = client.get(f"/jobs/{accepted['job_id']}").json()
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.05)
+    return {"seconds": round(time.perf_counter() - start_time, 4), "result": job["result"], "error": job["error"]}
+
+
+def bench_questions(client: TestClient, session_id: str, pages: int, count: int) -> Dict[str, Dict[str, float]]:
+    """
+    Ask `count` questions per intent path and summarise `/ask/` latency.
+
+    Returns:
+        Dict[str, Dict[str, float]]: Latency percentiles keyed by intent path.
+    """
+    latencies: Dict[str, List[float]] = {path: [] for path in QUESTIONS}
+    for i in range(count):
+        for path, template in QUESTIONS.items():
+            question = template.format(i=i, page=(i % pages) + 1)
+            start_time = time.perf_counter()
+            client.post("/ask/", params={"session_id": session_id}, json={"question": question})
+            latencies[path].append(time.perf_counter() - start_time)
+    return {path: percentiles(samples) for path, samples in latencies.items()}
+
+
+def bench_load(client: TestClient, path: str, clients: List[int], requests_per_client: int) -> Dict[str, Any]:
+    """
+    Measure `/ask/` throughput with increasing numbers of concurrent clients.
+
+    Each client has its own session on the same document and asks its
+    questions back to back. Throughput should grow with the client count
+    until the LLM gateway's slots are saturated.
+
+    Args:
+        client (TestClient): Client bound to the app.
+        path (str): Already-ingested PDF; each session re-uploads it from the cache.
+        clients (List[int]): Concurrency levels to try.
+        requests_per_client (int): Questions each client asks per level.
+
+    Returns:
+        Dict[str, Any]: Throughput and latency percentiles per concurrency level.
+    """
+    results = {}
+    for level in clients:
+        sessions = [f"load_{level}_{c}" for c in range(level)]
+        for session_id in sessions:
+            upload(client, path, session_id)
+
+        latencies: List[float] = []
+        lock = threading.Lock()
+
+        def worker(session_id: str):
+            for i in range(requests_per_client):
+                question = QUESTIONS["document content"].format(i=f"{session_id}-{i}")
+                start_time = time.perf_counter()
+                client.post("/ask/", params={"session_id": session_id}, json={"question": question})
+                with lock:
+                    latencies.append(time.perf_counter() - start_time)
+
+        threads = [threading.Thread(target=worker, args=(session_id,)) for session_id in sessions]
+        start_time = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start_time
+
+        results[f"clients_{level}"] = {
+            "requests_per_sec": round(len(latencies) / elapsed, 2),
+            "latency": percentiles(latencies),
+        }
+        print(f"[BENCH] load clients={level}: {results[f'clients_{level}']['requests_per_sec']} req/s")
+
+    base = results.get(f"clients_{clients[0]}", {}).get("requests_per_sec")
+    if base:
+        for entry in results.values():
+            entry["speedup"] = round(entry["requests_per_sec"] / base, 2)
+    return results
+
+
+def compare(current: dict, baseline: dict, prefix: str = "") -> List[str]:
+    """
+    Describe numeric differences between two result trees.
+
+    Returns:
+        List[str]: One line per metric present in both runs.
+    """
+    lines = []
+    for key, value in current.items():
+        other = baseline.get(key) if isinstance(baseline, dict) else None
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and isinstance(other, dict):
+            lines.extend(compare(value, other, name + "."))
+        elif isinstance(value, (int, float)) and isinstance(other, (int, float)) and other:
+            lines.append(f"{name}: {other} -> {value} ({(value - other) / other * 100:+.1f}%)")
+    return lines
+
+
+def run(args) -> dict:
+    """
+    Run the full benchmark and return its results.
+    """
+    random.seed(SEED)
+    np.random.seed(SEED)
+
+    # Keep the gateway in place so queueing and coalescing are measured too
+    chatbot.llm = GatewayLLM(gateway=LLMGateway(BenchmarkLLM(
+        first_token_latency=args.llm_latency,
+        token_latency=args.token_latency,
+    ), max_concurrency=args.llm_slots))
+    if not args.answer_cache:
+        answer_cache.similarity = 1.01  # Never hit
+    # Background summary builds would compete with /ask/ for LLM slots
+    summaries.SUMMARIES_ENABLED = False
+
+    from main import app
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "llm_latency": args.llm_latency,
+            "token_latency": args.token_latency,
+            "questions_per_path": args.questions,
+            "answer_cache": args.answer_cache,
+            "llm_slots": args.llm_slots,
+        },
+        "runs": {},
+    }
+
+    with tempfile.TemporaryDirectory() as workdir, TestClient(app) as client:
+        # Start from an empty document cache so uploads do real work
+        document_cache.CACHE_DIR = os.path.join(workdir, "cache")
+        for kind in args.kinds:
+            for pages in args.pages:
+                name = f"{kind}_{pages}p"
+                path = os.path.join(workdir, f"{name}.pdf")
+                make_pdf(path, pages, scanned=(kind == "scanned"))
+                print(f"[BENCH] {name}")
+
+                # Fresh embedding caches so stage timings and the upload both start cold
+                embedding_cache.CACHE_PATH = os.path.join(workdir, f"{name}_stages.sqlite3")
+                run_result = {"stages": bench_stages(path, pages, kind == "scanned")}
+                embedding_cache.CACHE_PATH = os.path.join(workdir, f"{name}_upload.sqlite3")
+                uploaded = upload(client, path, session_id=name)
+                run_result["upload_seconds"] = uploaded["seconds"]
+                run_result["upload_pages_per_sec"] = round(pages / uploaded["seconds"], 2)
+                if uploaded["error"]:
+                    run_result["error"] = uploaded["error"]
+                else:
+                    run_result["ask"] = bench_questions(client, name, pages, args.questions)
+                    if args.load_clients:
+                        run_result["load"] = bench_load(client, path, args.load_clients, args.load_requests)
+                results["runs"][name] = run_result
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark PDF ingestion and question answering.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--kinds", nargs="+", default=["digital", "scanned"], choices=["digital", "scanned"])
+    parser.add_argument("--questions", type=int, default=10, help="Questions per intent path")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Stand-in LLM seconds to first token")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Stand-in LLM seconds per token")
+    parser.add_argument("--answer-cache", action="store_true", help="Leave the semantic answer cache enabled")
+    parser.add_argument("--llm-slots", type=int, default=LLM_MAX_CONCURRENCY, help="Concurrent generations the stand-in LLM serves")
+    parser.add_argument("--load-clients", type=int, nargs="*", default=[], help="Concurrent client counts for the /ask/ load test")
+    parser.add_argument("--load-requests", type=int, default=5, help="Questions per client in the load test")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    results = run(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"[BENCH] Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        for line in compare(results["runs"], baseline.get("runs", {})):
+            print(line)
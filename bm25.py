@@ -0,0 +1,165 @@
+import json
+import math
+import os
+import re
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+# === Configuration ===
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Keeps identifiers such as "4.2.1", "AB-1234" or "v2/api" as one token
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase and split text into terms for lexical search.
+
+    Compound identifiers are emitted whole and as their parts, so "AB-1234"
+    matches queries for either "ab-1234" or "1234".
+
+    Args:
+        text (str): Text to tokenize.
+
+    Returns:
+        List[str]: Terms in order of appearance.
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(part for part in re.split(r"[._\-/]", token) if part)
+    return terms
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over document chunks.
+
+    Postings are stored in compressed-sparse-row form: for term id t, its
+    chunk ids and term frequencies are `posting_chunks[offsets[t]:offsets[t + 1]]`
+    and `posting_tf[...]`. Only the vocabulary is a Python dict.
+    """
+
+    def __init__(self, texts: Iterable[str]):
+        postings: Dict[str, Dict[int, int]] = {}
+        term_counts = []
+
+        for chunk_id, text in enumerate(texts):
+            terms = tokenize(text)
+            term_counts.append(len(terms))
+            for term in terms:
+                counts = postings.setdefault(term, {})
+                counts[chunk_id] = counts.get(chunk_id, 0) + 1
+
+        self.vocabulary: Dict[str, int] = {}
+        offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+        total = sum(len(counts) for counts in postings.values())
+        self.posting_chunks = np.empty(total, dtype=np.int32)
+        self.posting_tf = np.empty(total, dtype=np.float32)
+
+        position = 0
+        for term_id, (term, counts) in enumerate(postings.items()):
+            self.vocabulary[term] = term_id
+            chunk_ids = sorted(counts)
+            end = position + len(chunk_ids)
+            self.posting_chunks[position:end] = chunk_ids
+            self.posting_tf[position:end] = [counts[c] for c in chunk_ids]
+            position = end
+            offsets[term_id + 1] = end
+
+        lengths = np.asarray(term_counts, dtype=np.int32)
+        self.offsets = offsets
+        self.num_chunks = len(lengths)
+        self.avg_length = float(lengths.mean()) if len(lengths) else 0.0
+        # Precompute the per-chunk length normalisation of the BM25 denominator
+        self.length_norm = (
+            BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(self.avg_length, 1e-9))
+        ).astype(np.float32)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """
+        Return the top-scoring chunks for a query.
+
+        Args:
+            query (str): Free-text query.
+            k (int): Maximum number of results.
+
+        Returns:
+            List[Tuple[int, float]]: (chunk index, BM25 score) pairs, best first.
+        """
+        if not self.num_chunks:
+            return []
+
+        scores = np.zeros(self.num_chunks, dtype=np.float32)
+        matched = False
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            chunk_ids = self.posting_chunks[start:end]
+            tf = self.posting_tf[start:end]
+            df = end - start
+            idf = math.log(1 + (self.num_chunks - df + 0.5) / (df + 0.5))
+            scores[chunk_ids] += idf * tf * (BM25_K1 + 1) / (tf + self.length_norm[chunk_ids])
+            matched = True
+
+        if not matched:
+            return []
+
+        k = min(k, int(np.count_nonzero(scores)))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    ARRAYS = ("offsets", "posting_chunks", "posting_tf", "length_norm")
+
+    def save(self, directory: str):
+        """
+        Write the index as .npy arrays plus a JSON vocabulary.
+
+        Args:
+            directory (str): Destination directory (created if missing).
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(os.path.join(directory, "vocabulary.json"), "w", encoding="utf-8") as f:
+            json.dump({"terms": terms, "num_chunks": self.num_chunks, "avg_length": self.avg_length}, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "BM25Index":
+        """
+        Load an index written by `save`.
+
+        Args:
+            directory (str): Directory passed to `save`.
+            mmap (bool): Memory-map the posting arrays read-only so processes share them.
+
+        Returns:
+            BM25Index: Index ready for search.
+        """
+        index = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(index, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None))
+        with open(os.path.join(directory, "vocabulary.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        index.vocabulary = {term: term_id for term_id, term in enumerate(meta["terms"])}
+        index.num_chunks = meta["num_chunks"]
+        index.avg_length = meta["avg_length"]
+        return index
+
+    def size_bytes(self) -> int:
+        """
+        Approximate the RAM held by the posting arrays and vocabulary.
+
+        Returns:
+            int: Estimated size in bytes.
+        """
+        arrays = self.offsets.nbytes + self.posting_chunks.nbytes + self.posting_tf.nbytes + self.length_norm.nbytes
+        return arrays + sum(len(term) + 64 for term in self.vocabulary)
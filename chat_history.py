@@ -0,0 +1,159 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+# === Configuration ===
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", 10))  # Turns kept verbatim
+MAX_PENDING_TURNS = HISTORY_RECENT_TURNS * 4  # Unsummarised overflow kept if the summariser falls behind
+COMPACTION_BATCH_TURNS = int(os.getenv("COMPACTION_BATCH_TURNS", 5))  # Evicted turns folded per summariser call
+CHARS_PER_TOKEN = 4  # Rough estimate for English text
+
+# One background thread folds old turns into summaries for every session
+_compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-compactor")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of LLM tokens in a string.
+
+    Args:
+        text (str): Text to measure.
+
+    Returns:
+        int: Approximate token count.
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def format_turns(turns: List[dict]) -> str:
+    """
+    Format conversation turns as a User/Assistant transcript.
+
+    Args:
+        turns (List[dict]): Turns with 'user' and 'bot' entries.
+
+    Returns:
+        str: Transcript text.
+    """
+    return "\n".join(f"User: {turn['user']}\nAssistant: {turn['bot']}" for turn in turns)
+
+
+class ChatHistory:
+    """
+    Bounded conversation history: recent turns verbatim plus a rolling summary.
+
+    Turns pushed out of the ring buffer are folded into `summary` in the
+    background, so memory use and prompt size stay flat however long a
+    conversation runs. Indexing and slicing operate on the recent turns.
+    """
+
+    def __init__(self, max_recent: int = HISTORY_RECENT_TURNS):
+        self._recent = deque(maxlen=max_recent)
+        self._pending: List[dict] = []     # Evicted turns awaiting summarisation
+        self.summary = ""                  # Rolling summary of older turns
+        self.total_turns = 0
+        self._lock = threading.Lock()
+        self._compacting = False
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+    def __bool__(self) -> bool:
+        return bool(self._recent or self.summary or self._pending)
+
+    def __iter__(self):
+        return iter(list(self._recent))
+
+    def __getitem__(self, index):
+        return list(self._recent)[index]
+
+    def append(self, turn: dict):
+        """
+        Add a turn, moving the oldest recent turn to the summarisation queue if full.
+
+        Args:
+            turn (dict): Turn with 'user' and 'bot' entries.
+        """
+        with self._lock:
+            if len(self._recent) == self._recent.maxlen:
+                self._pending.append(self._recent[0])
+                if len(self._pending) > MAX_PENDING_TURNS:
+                    # Summariser is behind; drop the oldest rather than grow without bound
+                    del self._pending[: len(self._pending) - MAX_PENDING_TURNS]
+            self._recent.append(turn)
+            self.total_turns += 1
+
+    def schedule_compaction(self, summarize: Callable[[str, List[dict]], str]):
+        """
+        Fold pending turns into the rolling summary on the background thread.
+
+        Nothing is scheduled until COMPACTION_BATCH_TURNS turns are pending, so
+        a long conversation costs one summariser call per batch, not per turn.
+
+        Args:
+            summarize (Callable[[str, List[dict]], str]): Given the current summary and
+                the turns to fold in, returns the new summary.
+        """
+        with self._lock:
+            if len(self._pending) < COMPACTION_BATCH_TURNS or self._compacting:
+                return
+            self._compacting = True
+        _compactor.submit(self._compact, summarize)
+
+    def _compact(self, summarize: Callable[[str, List[dict]], str]):
+        try:
+            while True:
+                with self._lock:
+                    batch = list(self._pending)
+                    previous = self.summary
+                if len(batch) < COMPACTION_BATCH_TURNS:
+                    return
+                new_summary = summarize(previous, batch)
+                with self._lock:
+                    self.summary = new_summary.strip()
+                    # `append` may have trimmed the queue meanwhile; drop exactly the summarised turns
+                    summarised = {id(turn) for turn in batch}
+                    self._pending = [turn for turn in self._pending if id(turn) not in summarised]
+        except Exception as e:
+            print("[History Compaction Failed]", e)
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def render(self, token_budget: int, turns: Optional[List[dict]] = None) -> str:
+        """
+        Build a transcript for a prompt that fits within a token budget.
+
+        The newest turns are kept first; the rolling summary is included
+        ahead of them if there is room.
+
+        Args:
+            token_budget (int): Maximum estimated tokens for the returned text.
+            turns (List[dict], optional): Turns to draw from; defaults to every turn not
+                yet folded into the summary (queued turns, then recent ones).
+
+        Returns:
+            str: Summary and transcript text.
+        """
+        with self._lock:
+            turns = self._pending + list(self._recent) if turns is None else list(turns)
+            summary = self.summary
+
+        kept = []
+        used = 0
+        for turn in reversed(turns):
+            cost = estimate_tokens(format_turns([turn])) + 1
+            if used + cost > token_budget:
+                break
+            kept.append(turn)
+            used += cost
+        kept.reverse()
+
+        text = format_turns(kept)
+        if summary:
+            summary_text = f"Summary of earlier conversation: {summary}"
+            if used + estimate_tokens(summary_text) + 1 <= token_budget:
+                text = f"{summary_text}\n{text}" if text else summary_text
+        return text
@@ -1,32 +1,99 @@
-from langchain_community.vectorstores import FAISS
-from langchain_community.llms import Ollama
 from langchain.agents import initialize_agent, Tool, AgentType
-from langchain.embeddings.base import Embeddings
-from langchain.schema.document import Document
-from langchain.memory import ConversationBufferMemory
-from PyPDF2 import PdfReader
-
-from shared_state import shared_state
-from typing import List
+from langchain.memory import ReadOnlySharedMemory
+from langchain.callbacks.base import BaseCallbackHandler
+
+from shared_state import SharedState, DocumentState, state_registry
+from chat_history import format_turns
+from document import ParsedDocument
+from router import route_intent, route_memory
+from answer_cache import answer_cache
+from embeddings import embed_query
+from retrieval import build_context
+from metrics import span, timed, observe_llm_call, LLMMetricsHandler
+import document_cache
+from llm_gateway import (
+    GatewayLLM, LLMGateway, OllamaBackend,
+    PRIORITY_CLASSIFY, PRIORITY_ANSWER, PRIORITY_BACKGROUND,
+)
+from typing import Iterator, List
+import queue
 import re
+import threading
 
 # === Configuration ===
-MEMORY_DEPTH = 50  # Number of chat turns to retain in memory
+MEMORY_TOKEN_BUDGET = 1500        # History tokens allowed in the memory-recall prompt
+AGENT_HISTORY_TOKEN_BUDGET = 800  # History tokens allowed in the agent prompt
+SUMMARY_MAX_WORDS = 150           # Target length of the rolling history summary
+DOCUMENT_SEARCH_TOKEN_BUDGET = 400  # Context tokens returned by the agent's search tool
+
+# Queue priority per call purpose; classification jumps ahead of long answers
+LLM_PRIORITIES = {
+    "detect_intent": PRIORITY_CLASSIFY,
+    "needs_memory": PRIORITY_CLASSIFY,
+    "history_summary": PRIORITY_BACKGROUND,
+    "document_summary": PRIORITY_BACKGROUND,
+}
+
+# What each level of the document summary tree condenses
+SUMMARY_LEVELS = {
+    "chunks": ("an excerpt of a PDF page", 80),
+    "page": ("notes on parts of one PDF page", 80),
+    "section": ("summaries of consecutive PDF pages", 120),
+    "document": ("summaries of the sections of a PDF", 200),
+}
+
+# Questions the summary tree answers; matched against the lowercased question
+# without trailing punctuation, so anything more specific falls through to the agent
+_DOCUMENT = r"(?:this|the) (?:document|pdf|file|report)"
+SUMMARY_DOCUMENT_QUESTION = re.compile(
+    rf"^(?:(?:please|can you|could you) )?(?:summari[sz]e {_DOCUMENT}|"
+    rf"give (?:me )?an? (?:short |brief )?(?:summary|overview) of {_DOCUMENT}|"
+    rf"what is {_DOCUMENT} about|tl;?dr)(?: please)?$"
+)
+SUMMARY_OUTLINE_QUESTION = re.compile(
+    rf"^(?:(?:please )?give (?:me )?)?an? (?:outline|section[- ]by[- ]section summary) of {_DOCUMENT}$"
+)
+SUMMARY_PAGE_QUESTION = re.compile(
+    r"^(?:what(?:'s| is) (?:on|in) page (\d+)|summari[sz]e page (\d+)|what does page (\d+) (?:say|contain|cover))$"
+)
+
+# === Initialize local LLM (Phi-3 via Ollama, behind the gateway) ===
+llm = GatewayLLM(gateway=LLMGateway(OllamaBackend(model="phi3", temperature=0)))
+
+
+def _invoke_llm(prompt: str, purpose: str) -> str:
+    """
+    Call the LLM and record the call's prompt and completion sizes.
 
-# === Initialize local LLM (Phi-3 via Ollama) ===
-llm = Ollama(model="phi3", temperature=0)
+    Args:
+        prompt (str): Prompt to send.
+        purpose (str): Metrics label for the call.
+
+    Returns:
+        str: Generated text.
+    """
+    completion = llm.invoke(prompt, priority=LLM_PRIORITIES.get(purpose, PRIORITY_ANSWER))
+    observe_llm_call(purpose, prompt, completion)
+    return completion
 
 
+@timed("detect_intent")
 def detect_intent(question: str) -> str:
     """
     Classify a user question into a specific intent category.
 
+    The local router answers first; the LLM is only asked when it is unsure.
+
     Args:
         question (str): The user's input question.
 
     Returns:
         str: One of [page stats, page info, document content, summarization, unknown]
     """
+    intent = route_intent(question)
+    if intent is not None:
+        return intent
+
     prompt = f"""
 You are an intelligent assistant.
 
@@ -37,83 +104,95 @@ Classify the user's question into one of the following intents:
 - summarization
 - unknown
 
-Question: {question}
-
 Only respond with a single intent label.
+
+Question: {question}
 """
     try:
-        return llm.invoke(prompt).strip().lower()
+        return _invoke_llm(prompt, "detect_intent").strip().lower()
     except Exception as e:
         print("[Intent Detection Error]", e)
         return "unknown"
 
 
-def needs_memory(question: str) -> bool:
+@timed("needs_memory")
+def needs_memory(question: str, history: List[dict]) -> bool:
     """
     Determine if the question depends on prior conversation context.
 
+    The local router answers first; the LLM is only asked when it is unsure.
+
     Args:
         question (str): The user's current question.
+        history (List[dict]): The session's past conversation turns.
 
     Returns:
         bool: True if memory is needed, else False.
     """
+    if not history:
+        return False
+
+    decision = route_memory(question)
+    if decision is not None:
+        return decision
+
     prompt = f"""
 Does the following question depend on past conversation context?
+Answer with "yes" or "no" only.
 
 Question: "{question}"
-Answer with "yes" or "no" only.
 """
     try:
-        return llm.invoke(prompt).strip().lower().startswith("yes")
+        return _invoke_llm(prompt, "needs_memory").strip().lower().startswith("yes")
     except Exception as e:
         print("[Memory Detection Error]", e)
         return False
 
 
-def get_pdf_stats() -> str:
+def get_pdf_stats(document: ParsedDocument) -> str:
     """
     Extract and return basic statistics from the uploaded PDF.
 
+    Args:
+        document (ParsedDocument): The parsed document.
+
     Returns:
         str: A human-readable summary of page, word, sentence, and paragraph counts.
     """
-    text = shared_state.global_text
-    page_count = shared_state.page_count or 0
-    word_count = len(text.split())
-    sentence_count = len(re.findall(r'[.!?]', text))
-    paragraph_count = len(re.split(r'\n\s*\n', text))
-
+    stats = document.stats()
     return (
         f"The document contains:\n"
-        f"- {page_count} pages\n"
-        f"- {word_count} words\n"
-        f"- {sentence_count} sentences\n"
-        f"- {paragraph_count} paragraphs"
+        f"- {stats['pages']} pages\n"
+        f"- {stats['words']} words\n"
+        f"- {stats['sentences']} sentences\n"
+        f"- {stats['paragraphs']} paragraphs"
     )
 
 
-def document_search_tool_fn(query: str, vectorstore: FAISS) -> str:
+@timed("tool_document_search")
+def document_search_tool_fn(query: str, doc_state: DocumentState) -> str:
     """
-    Use vector search to retrieve the most relevant document chunk.
+    Use hybrid BM25 + vector search to retrieve a compact, page-labelled context.
 
     Args:
         query (str): The search query.
-        vectorstore (FAISS): The FAISS vectorstore.
+        doc_state (DocumentState): Document to search.
 
     Returns:
         str: Matching content or fallback message.
     """
-    docs: List[Document] = vectorstore.similarity_search(query, k=1)
-    return docs[0].page_content.strip() if docs else "No relevant information found in the document."
+    context = build_context(query, doc_state, DOCUMENT_SEARCH_TOKEN_BUDGET)
+    return context or "No relevant information found in the document."
 
 
-def page_inspector_tool_fn(query: str) -> str:
+@timed("tool_page_inspector")
+def page_inspector_tool_fn(query: str, document: ParsedDocument) -> str:
     """
     Extract content from a specific page number in the uploaded PDF.
 
     Args:
         query (str): The user's query mentioning a page number.
+        document (ParsedDocument): The parsed document.
 
     Returns:
         str: Page content or error message.
@@ -123,140 +202,436 @@ def page_inspector_tool_fn(query: str) -> str:
         return "Please specify a page number."
 
     page_num = int(match.group(1))
-    try:
-        reader = PdfReader(f"uploads/{shared_state.uploaded_filename}")
-        if 1 <= page_num <= len(reader.pages):
-            text = reader.pages[page_num - 1].extract_text()
-            return text.strip() if text else f"Page {page_num} is empty."
-        else:
-            return f"Page {page_num} is out of range (max page: {len(reader.pages)})."
-    except Exception as e:
-        return f"Failed to extract text from page {page_num}: {e}"
+    if 1 <= page_num <= document.page_count:
+        text = document.get_page(page_num)
+        return text if text else f"Page {page_num} is empty."
+    else:
+        return f"Page {page_num} is out of range (max page: {document.page_count})."
 
 
-def chat_with_agent(
-    question: str,
-    vectorstore: FAISS,
-    embeddings_model: Embeddings,
-    history: List[dict],
-) -> str:
+class FinalAnswerStreamHandler(BaseCallbackHandler):
+    """
+    Forward LLM tokens that follow the agent's "Final Answer:" marker to a queue.
+
+    Intermediate ReAct steps (thoughts, actions) are buffered and discarded.
     """
-    Handle user interaction using memory, tools, or fallback vector search.
+
+    ANSWER_PREFIX = "Final Answer:"
+
+    def __init__(self, token_queue: queue.Queue):
+        self.token_queue = token_queue
+        self.streamed = False
+        self._buffer = ""
+        self._in_answer = False
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._buffer = ""
+        self._in_answer = False
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        if self._in_answer:
+            self.token_queue.put(token)
+            return
+
+        self._buffer += token
+        index = self._buffer.find(self.ANSWER_PREFIX)
+        if index != -1:
+            self._in_answer = True
+            self.streamed = True
+            rest = self._buffer[index + len(self.ANSWER_PREFIX):].lstrip()
+            if rest:
+                self.token_queue.put(rest)
+
+
+def summarize_turns(previous_summary: str, turns: List[dict]) -> str:
+    """
+    Fold older conversation turns into the rolling history summary.
+
+    Runs on the history compaction thread, never on the request path.
+
+    Args:
+        previous_summary (str): Current summary (may be empty).
+        turns (List[dict]): Turns to add to the summary, oldest first.
+
+    Returns:
+        str: Updated summary.
+    """
+    prompt = f"""
+Update the summary of a conversation between a user and an assistant about a PDF.
+Write the updated summary in at most {SUMMARY_MAX_WORDS} words. Keep facts, names and numbers the user may refer back to.
+
+Current summary:
+{previous_summary or "(none)"}
+
+New turns:
+{format_turns(turns)}
+
+Summary:"""
+    return _invoke_llm(prompt, "history_summary").strip()
+
+
+def summarize_document_part(level: str, text: str) -> str:
+    """
+    Summarise one node of a document's summary tree.
+
+    Runs on the summary builder's threads after ingestion, never on the request path.
+
+    Args:
+        level (str): Tree level: chunks, page, section or document.
+        text (str): Text or child summaries to condense.
+
+    Returns:
+        str: Summary.
+    """
+    source, max_words = SUMMARY_LEVELS[level]
+    prompt = f"""
+Summarise the text below, which contains {source}.
+Write at most {max_words} words. Keep names, numbers and key facts; do not add anything that is not in the text.
+
+Text:
+\"\"\"
+{text}
+\"\"\"
+
+Summary:"""
+    return _invoke_llm(prompt, "document_summary").strip()
+
+
+def summary_answer(question: str, doc_state: DocumentState):
+    """
+    Answer plain overview questions from the document's precomputed summary tree.
+
+    Only questions that ask for nothing more than an overview are answered:
+    "summarize the document", "outline of the document" and "what is on
+    page N". Anything more specific ("what does page 5 say about fees?",
+    "summarize section 3") returns None and goes to the agent.
 
     Args:
         question (str): User's question.
-        vectorstore (FAISS): Vectorstore for document retrieval.
-        embeddings_model (Embeddings): Embedding model.
-        history (List[dict]): List of past conversation turns.
+        doc_state (DocumentState): Document being asked about.
 
     Returns:
-        str: Assistant's response.
+        str | None: Answer, or None if the tree cannot answer it (not a plain
+        overview question, tree not built yet, or an empty page).
     """
+    normalised = re.sub(r"\s+", " ", question.lower()).strip().rstrip("?.! ")
+    page_match = SUMMARY_PAGE_QUESTION.match(normalised)
+    wants_document = SUMMARY_DOCUMENT_QUESTION.match(normalised) is not None
+    wants_outline = SUMMARY_OUTLINE_QUESTION.match(normalised) is not None
+    if not (page_match or wants_document or wants_outline):
+        return None
+
+    tree = doc_state.summaries
+    if tree is None:
+        # Another worker process may have finished the build
+        tree = doc_state.summaries = document_cache.load_summaries(doc_state.doc_id)
+    if tree is None:
+        return None
+
+    if wants_document:
+        return tree.document or None
+    if wants_outline:
+        return "\n".join(
+            f"Pages {section['first_page']}-{section['last_page']}: {section['summary']}"
+            if section["first_page"] != section["last_page"]
+            else f"Page {section['first_page']}: {section['summary']}"
+            for section in tree.sections
+        ) or None
+
+    page_num = int(next(group for group in page_match.groups() if group))
+    summary = tree.page(page_num)
+    return f"Page {page_num}: {summary}" if summary else None
+
+
+def _record_turn(session: SharedState, question: str, answer: str):
+    """
+    Append a turn to the session history and compact older turns in the background.
 
-    # === Case 1: Context-dependent question ===
-    if needs_memory(question):
-        try:
-            history_slice = shared_state.chat_history[-MEMORY_DEPTH:]
-            chat_context = "\n".join(
-                f"User: {m['user']}\nAssistant: {m['bot']}" for m in history_slice
-            )
-            memory_prompt = f"""
-You are a helpful assistant with memory.
+    Args:
+        session (SharedState): Session receiving the turn.
+        question (str): User's question.
+        answer (str): Assistant's answer.
+    """
+    session.add_to_history(question, answer)
+    session.chat_history.schedule_compaction(summarize_turns)
 
-Here is the previous conversation:
-{chat_context}
 
-Now answer this question using only the history above.
+def _stream_llm(prompt: str, purpose: str) -> Iterator[str]:
+    """
+    Stream an LLM completion, dropping leading whitespace.
 
-User: {question}
-Assistant:"""
-            answer = llm.invoke(memory_prompt).strip()
-            shared_state.chat_history.append({"user": question, "bot": answer})
-            return answer
+    Args:
+        prompt (str): Prompt to send.
+        purpose (str): Metrics label for the call.
+
+    Yields:
+        str: Generated tokens.
+    """
+    started = False
+    completion = []
+    for token in llm.stream(prompt, priority=LLM_PRIORITIES.get(purpose, PRIORITY_ANSWER)):
+        if not started:
+            token = token.lstrip()
+            if not token:
+                continue
+            started = True
+        completion.append(token)
+        yield token
+    observe_llm_call(purpose, prompt, "".join(completion))
+
+
+def _stream_agent(agent, prompt: str) -> Iterator[str]:
+    """
+    Run the agent in a worker thread and stream its final answer tokens.
+
+    Args:
+        agent: Initialised LangChain agent executor.
+        prompt (str): Prompt including history and the question.
+
+    Yields:
+        str: Final answer tokens. If the answer could not be streamed, it is yielded whole.
+
+    Raises:
+        RuntimeError: If the agent fails, returns nothing or stops on a limit.
+    """
+    token_queue = queue.Queue()
+    handler = FinalAnswerStreamHandler(token_queue)
+    outcome = {}
+    done = object()
+
+    def run():
+        try:
+            with span("agent_run"):
+                outcome["response"] = agent.run(
+                    prompt, callbacks=[handler, LLMMetricsHandler("agent")]
+                ).strip()
         except Exception as e:
-            print("[Memory Recall Failed]", e)
-            fallback = "Sorry, I couldn't recall that properly."
-            shared_state.chat_history.append({"user": question, "bot": fallback})
-            return fallback
+            outcome["error"] = e
+        finally:
+            token_queue.put(done)
 
-    # === Case 2: Stateless — classify intent ===
-    intent = detect_intent(question)
+    threading.Thread(target=run, daemon=True).start()
+
+    while True:
+        token = token_queue.get()
+        if token is done:
+            break
+        yield token
+
+    if "error" in outcome:
+        raise outcome["error"]
+
+    response = outcome.get("response", "")
+    if not response or response.lower() in [
+        "agent stopped due to iteration limit or time limit.",
+        "agent stopped due to time limit.",
+        "agent stopped due to iteration limit.",
+    ]:
+        raise RuntimeError("Agent returned empty or timed out.")
+
+    if not handler.streamed:
+        yield response
 
-    if intent == "page stats":
-        response = get_pdf_stats()
-        shared_state.chat_history.append({"user": question, "bot": response})
-        return response
 
-    # === Case 3: Use tools ===
+def _session_document(session: SharedState) -> DocumentState:
+    doc_state = state_registry.get_document(session.doc_id)
+    if doc_state is None:
+        raise RuntimeError("The session's document is no longer available.")
+    return doc_state
+
+
+def get_session_agent(session: SharedState):
+    """
+    Return the session's agent, building it only when the document changes.
+
+    Tools look up the session's document at call time, so the agent never
+    pins an evicted document in memory. The agent reads the session's
+    window memory, which `add_to_history` keeps up to date turn by turn.
+
+    Args:
+        session (SharedState): Session that owns the agent.
+
+    Returns:
+        AgentExecutor: Ready-to-run ReAct agent.
+    """
+    if session.agent is not None and session.agent_doc_id == session.doc_id:
+        return session.agent
+
     tools = [
         Tool(
             name="DocumentSearch",
-            func=lambda q: document_search_tool_fn(q, vectorstore),
+            func=lambda q: document_search_tool_fn(q, _session_document(session)),
             description="Finds relevant content from the uploaded PDF"
         ),
         Tool(
             name="PageInspector",
-            func=page_inspector_tool_fn,
+            func=lambda q: page_inspector_tool_fn(q, _session_document(session).document),
             description="Extracts content from specific pages"
         )
     ]
 
-    recent_history = history[-MEMORY_DEPTH:]
-    formatted_history = "\n".join(
-        f"User: {turn['user']}\nAssistant: {turn['bot']}" for turn in recent_history
+    session.agent = initialize_agent(
+        tools=tools,
+        llm=llm,
+        agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+        # Read-only: turns are recorded once via add_to_history, not by the executor
+        memory=ReadOnlySharedMemory(memory=session.memory),
+        verbose=False,
+        max_iterations=4,
+        max_execution_time=15
     )
-    prompt_with_history = f"""{formatted_history}
+    session.agent_doc_id = session.doc_id
+    print(f"[INFO] Built agent for session {session.session_id}")
+    return session.agent
+
+
+def chat_with_agent_stream(
+    question: str,
+    session: SharedState,
+    doc_state: DocumentState,
+    history: List[dict],
+) -> Iterator[str]:
+    """
+    Stream the answer to a question token by token.
+
+    Follows the same memory, tool and fallback paths as `chat_with_agent`;
+    the complete answer is appended to the chat history once the stream ends.
+
+    Args:
+        question (str): User's question.
+        session (SharedState): Session whose chat history receives the turn.
+        doc_state (DocumentState): Document being asked about.
+        history (List[dict]): List of past conversation turns.
+
+    Yields:
+        str: Answer tokens.
+    """
+    answer_parts = []
+
+    # === Case 1: Context-dependent question ===
+    if needs_memory(question, session.chat_history):
+        try:
+            chat_context = session.chat_history.render(MEMORY_TOKEN_BUDGET)
+            memory_prompt = f"""
+You are a helpful assistant with memory.
+Answer the user's question using only the previous conversation below.
+
+Previous conversation:
+{chat_context}
+
 User: {question}
 Assistant:"""
+            for token in _stream_llm(memory_prompt, "memory_answer"):
+                answer_parts.append(token)
+                yield token
+            _record_turn(session, question, "".join(answer_parts).strip())
+            return
+        except Exception as e:
+            print("[Memory Recall Failed]", e)
+            fallback = "Sorry, I couldn't recall that properly."
+            if not answer_parts:
+                yield fallback
+            _record_turn(session, question, "".join(answer_parts).strip() or fallback)
+            return
+
+    # === Case 2: Stateless — answer from cache if an equivalent question was asked ===
+    doc_hash = doc_state.doc_id
+    question_vector = embed_query(question)
+    cached = answer_cache.get(doc_hash, question, question_vector)
+    if cached is not None:
+        _record_turn(session, question, cached)
+        yield cached
+        return
+
+    # === Case 3: Stateless — classify intent ===
+    intent = detect_intent(question)
+    # Page answers depend on a number the embedding barely encodes; never reuse them
+    cache_answer = intent != "page info"
 
-    try:
-        memory = ConversationBufferMemory(memory_key="chat_history", return_messages=False)
-        for turn in recent_history:
-            memory.chat_memory.add_user_message(turn["user"])
-            memory.chat_memory.add_ai_message(turn["bot"])
-
-        agent = initialize_agent(
-            tools=tools,
-            llm=llm,
-            agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-            memory=memory,
-            verbose=False,
-            max_iterations=4,
-            max_execution_time=15
-        )
+    if intent == "page stats":
+        response = get_pdf_stats(doc_state.document)
+        _record_turn(session, question, response)
+        answer_cache.put(doc_hash, question, question_vector, response)
+        yield response
+        return
+
+    response = summary_answer(question, doc_state)
+    if response is not None:
+        _record_turn(session, question, response)
+        if cache_answer:
+            answer_cache.put(doc_hash, question, question_vector, response)
+        yield response
+        return
+
+    # === Case 4: Use tools ===
+    prompt_with_history = f"""{session.chat_history.render(AGENT_HISTORY_TOKEN_BUDGET, history)}
+User: {question}
+Assistant:"""
 
-        response = agent.run(prompt_with_history).strip()
+    try:
+        agent = get_session_agent(session)
 
-        if not response or response.lower() in [
-            "agent stopped due to iteration limit or time limit.",
-            "agent stopped due to time limit.",
-            "agent stopped due to iteration limit.",
-        ]:
-            raise RuntimeError("Agent returned empty or timed out.")
+        for token in _stream_agent(agent, prompt_with_history):
+            answer_parts.append(token)
+            yield token
 
-        shared_state.chat_history.append({"user": question, "bot": response})
-        return response
+        answer = "".join(answer_parts).strip()
+        _record_turn(session, question, answer)
+        if cache_answer:
+            answer_cache.put(doc_hash, question, question_vector, answer)
+        return
 
     except Exception as e:
         print("[Agent Fallback Triggered]", e)
+        if answer_parts:
+            # Part of the answer already reached the client; keep what was sent
+            _record_turn(session, question, "".join(answer_parts).strip())
+            return
 
-        # === Final fallback: Vector-based search + prompt ===
-        try:
-            docs: List[Document] = vectorstore.similarity_search(question, k=3)
-            context = "\n\n".join([doc.page_content for doc in docs])
+    # === Final fallback: Vector-based search + prompt ===
+    try:
+        with span("fallback_rag"):
+            context = build_context(question, doc_state)
             fallback_prompt = f"""
 You are a helpful assistant answering questions about a PDF.
+Answer the question using only the context below.
 
-Use only this context:
+Context:
 \"\"\"
 {context}
 \"\"\"
 
 Question: {question}
 Answer:"""
-            answer = llm.invoke(fallback_prompt).strip()
-            shared_state.chat_history.append({"user": question, "bot": answer})
-            return answer
-        except Exception as e2:
-            print("[Final Fallback Failed]", e2)
-            return "Sorry, the assistant could not generate an answer."
+            for token in _stream_llm(fallback_prompt, "fallback_answer"):
+                answer_parts.append(token)
+                yield token
+            answer = "".join(answer_parts).strip()
+            _record_turn(session, question, answer)
+            if cache_answer:
+                answer_cache.put(doc_hash, question, question_vector, answer)
+    except Exception as e2:
+        print("[Final Fallback Failed]", e2)
+        if not answer_parts:
+            yield "Sorry, the assistant could not generate an answer."
+
+
+def chat_with_agent(
+    question: str,
+    session: SharedState,
+    doc_state: DocumentState,
+    history: List[dict],
+) -> str:
+    """
+    Handle user interaction using memory, tools, or fallback vector search.
+
+    Args:
+        question (str): User's question.
+        session (SharedState): Session whose chat history receives the turn.
+        doc_state (DocumentState): Document being asked about.
+        history (List[dict]): List of past conversation turns.
+
+    Returns:
+        str: Assistant's response.
+    """
+    return "".join(chat_with_agent_stream(question, session, doc_state, history)).strip()
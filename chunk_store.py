@@ -0,0 +1,190 @@
+import os
+from typing import Iterator, List, Optional, Union
+
+import numpy as np
+
+TEXT_FILE = "text.bin"
+
+
+def _map_text(path: str, mmap: bool):
+    if not mmap or os.path.getsize(path) == 0:
+        with open(path, "rb") as f:
+            return f.read()
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+class ChunkStore:
+    """
+    Compact storage for a document's chunks.
+
+    The text lives once in a UTF-8 buffer shared with the parsed document;
+    chunks are byte ranges into it, held in parallel integer arrays with their
+    page numbers and FAISS row ids. Chunk strings are only decoded when asked
+    for, e.g. for the few chunks a search returns. Saved stores can be
+    memory-mapped, so resident documents cost little private RAM.
+    """
+
+    ARRAYS = ("starts", "ends", "pages", "rows")
+
+    def __init__(self, buffer, starts: np.ndarray, ends: np.ndarray, pages: np.ndarray, rows: np.ndarray):
+        self.buffer = buffer    # UTF-8 text: bytes, or a read-only uint8 memmap
+        self.starts = starts    # Byte offset where each chunk begins
+        self.ends = ends        # Byte offset where each chunk ends
+        self.pages = pages      # 1-based page of each chunk, 0 if unknown
+        self.rows = rows        # FAISS row id of each chunk
+        self._row_to_chunk: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_chunks(cls, chunks: List[dict], buffer: Optional[bytes] = None) -> "ChunkStore":
+        """
+        Build a store from chunk dictionaries.
+
+        Args:
+            chunks (List[dict]): Chunks with 'content' and 'metadata' ('page', and
+                'start'/'end' byte offsets when `buffer` is given).
+            buffer (bytes, optional): Document text the offsets point into. Without it,
+                the chunk contents are concatenated into a buffer of their own.
+
+        Returns:
+            ChunkStore: Store whose FAISS row ids follow chunk order.
+        """
+        count = len(chunks)
+        starts = np.empty(count, dtype=np.int64)
+        ends = np.empty(count, dtype=np.int64)
+        pages = np.zeros(count, dtype=np.int32)
+
+        if buffer is None:
+            parts = []
+            offset = 0
+            for i, chunk in enumerate(chunks):
+                data = chunk["content"].encode("utf-8")
+                starts[i], ends[i] = offset, offset + len(data)
+                parts.append(data)
+                offset += len(data)
+            buffer = b"".join(parts)
+        else:
+            for i, chunk in enumerate(chunks):
+                starts[i] = chunk["metadata"]["start"]
+                ends[i] = chunk["metadata"]["end"]
+
+        for i, chunk in enumerate(chunks):
+            page = chunk["metadata"].get("page")
+            if isinstance(page, int):
+                pages[i] = page
+
+        return cls(buffer, starts, ends, pages, np.arange(count, dtype=np.int32))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def text(self, chunk_id: int) -> str:
+        """
+        Decode one chunk's text.
+
+        Args:
+            chunk_id (int): Chunk index.
+
+        Returns:
+            str: Chunk text.
+        """
+        return self.span_text(int(self.starts[chunk_id]), int(self.ends[chunk_id]))
+
+    def span_text(self, start: int, end: int) -> str:
+        """
+        Decode an arbitrary byte range of the buffer, e.g. several adjacent chunks.
+
+        Args:
+            start (int): Start byte offset.
+            end (int): End byte offset.
+
+        Returns:
+            str: Decoded text.
+        """
+        return bytes(self.buffer[start:end]).decode("utf-8", errors="ignore")
+
+    def texts(self) -> Iterator[str]:
+        """
+        Decode every chunk in order, one at a time.
+
+        Yields:
+            str: Chunk text.
+        """
+        for chunk_id in range(len(self)):
+            yield self.text(chunk_id)
+
+    def page(self, chunk_id: int) -> Union[int, str]:
+        page = int(self.pages[chunk_id])
+        return page if page > 0 else "unknown"
+
+    def __getitem__(self, chunk_id: int) -> dict:
+        """
+        Materialise one chunk as a dictionary with 'content' and 'metadata'.
+        """
+        chunk_id = int(chunk_id)
+        if not 0 <= chunk_id < len(self):
+            raise IndexError(chunk_id)
+        return {
+            "content": self.text(chunk_id),
+            "metadata": {
+                "page": self.page(chunk_id),
+                "start": int(self.starts[chunk_id]),
+                "end": int(self.ends[chunk_id]),
+            },
+        }
+
+    def chunks_for_rows(self, rows) -> List[int]:
+        """
+        Map FAISS row ids returned by a search to chunk indexes.
+
+        Args:
+            rows (Iterable[int]): Row ids (negative ids, FAISS's "no result", are dropped).
+
+        Returns:
+            List[int]: Chunk indexes, in the same order.
+        """
+        if self._row_to_chunk is None:
+            mapping = np.full(int(self.rows.max()) + 1 if len(self) else 0, -1, dtype=np.int64)
+            mapping[self.rows] = np.arange(len(self))
+            self._row_to_chunk = mapping
+        return [int(self._row_to_chunk[row]) for row in rows if 0 <= row < len(self._row_to_chunk)]
+
+    def save(self, directory: str):
+        """
+        Write the text buffer and arrays so `load` can memory-map them.
+
+        Args:
+            directory (str): Destination directory (created if missing).
+        """
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, TEXT_FILE), "wb") as f:
+            f.write(bytes(self.buffer))
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "ChunkStore":
+        """
+        Load a store written by `save`.
+
+        Args:
+            directory (str): Directory passed to `save`.
+            mmap (bool): Memory-map the buffer and arrays read-only so processes share them.
+
+        Returns:
+            ChunkStore: The restored store.
+        """
+        buffer = _map_text(os.path.join(directory, TEXT_FILE), mmap)
+        arrays = [
+            np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+            for name in cls.ARRAYS
+        ]
+        return cls(buffer, *arrays)
+
+    def size_bytes(self) -> int:
+        """
+        Approximate the memory held by the buffer and arrays.
+
+        Returns:
+            int: Size in bytes.
+        """
+        return len(self.buffer) + sum(getattr(self, name).nbytes for name in self.ARRAYS)
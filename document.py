@@ -0,0 +1,156 @@
+import re
+from typing import List, Tuple
+
+import numpy as np
+
+PAGE_SEPARATOR = "\n\n"
+
+
+def encode_pages(pages: List[str]) -> Tuple[bytes, np.ndarray]:
+    """
+    Join page texts into one UTF-8 buffer and record each page's byte span.
+
+    Pages are separated by PAGE_SEPARATOR; empty pages get an empty span.
+
+    Args:
+        pages (List[str]): Text of each page, in order.
+
+    Returns:
+        Tuple[bytes, np.ndarray]: The buffer and an (n, 2) array of start/end offsets.
+    """
+    separator = PAGE_SEPARATOR.encode("utf-8")
+    spans = np.zeros((len(pages), 2), dtype=np.int64)
+    parts = []
+    offset = 0
+    for i, page_text in enumerate(pages):
+        if not page_text:
+            spans[i] = (offset, offset)
+            continue
+        if parts:
+            parts.append(separator)
+            offset += len(separator)
+        data = page_text.encode("utf-8")
+        spans[i] = (offset, offset + len(data))
+        parts.append(data)
+        offset += len(data)
+    return b"".join(parts), spans
+
+
+class ParsedDocument:
+    """
+    Model of a PDF that has been parsed once.
+
+    The joined document text is held once, as a UTF-8 buffer (bytes, or a
+    read-only memory map after a reload) shared with the document's chunk
+    store. Each page's byte span is recorded, so page text, the full text and
+    statistics are decoded on demand and never require re-opening the file.
+    """
+
+    def __init__(self, filename: str, pages: List[str]):
+        buffer, page_spans = encode_pages(pages)
+        self._setup(filename, buffer, page_spans)
+
+    @classmethod
+    def from_buffer(cls, filename: str, buffer, page_spans) -> "ParsedDocument":
+        """
+        Wrap an existing text buffer, e.g. a memory-mapped chunk store's.
+
+        Args:
+            filename (str): Original file name.
+            buffer (bytes | np.memmap): UTF-8 document text.
+            page_spans (array-like): (n, 2) byte start/end of each page.
+
+        Returns:
+            ParsedDocument: Document backed by `buffer`.
+        """
+        document = cls.__new__(cls)
+        document._setup(filename, buffer, np.asarray(page_spans, dtype=np.int64).reshape(-1, 2))
+        return document
+
+    def _setup(self, filename: str, buffer, page_spans: np.ndarray):
+        self.filename = filename
+        self.buffer = buffer
+        self.page_spans = page_spans
+        self.page_count = len(page_spans)
+        self._stats = None
+
+    @property
+    def text(self) -> str:
+        """
+        Decode the full document text.
+        """
+        return bytes(self.buffer).decode("utf-8", errors="ignore")
+
+    @property
+    def pages(self) -> List[str]:
+        """
+        Decode every page's text.
+        """
+        return [self.get_page(n) for n in range(1, self.page_count + 1)]
+
+    def get_page(self, page_num: int) -> str:
+        """
+        Return the text of a page.
+
+        Args:
+            page_num (int): 1-based page number.
+
+        Returns:
+            str: Page text (empty string if the page has none).
+
+        Raises:
+            IndexError: If the page number is out of range.
+        """
+        if not 1 <= page_num <= self.page_count:
+            raise IndexError(page_num)
+        start, end = self.page_spans[page_num - 1]
+        return bytes(self.buffer[start:end]).decode("utf-8", errors="ignore")
+
+    def stats(self) -> dict:
+        """
+        Return word, sentence and paragraph counts, computed once.
+
+        Returns:
+            dict: Page, word, sentence and paragraph counts.
+        """
+        if self._stats is None:
+            text = self.text
+            self._stats = {
+                "pages": self.page_count,
+                "words": len(text.split()),
+                "sentences": len(re.findall(r'[.!?]', text)),
+                "paragraphs": len(re.split(r'\n\s*\n', text)),
+            }
+        return self._stats
+
+    def size_bytes(self) -> int:
+        """
+        Approximate the memory held by the text buffer and page spans.
+
+        Returns:
+            int: Size in bytes.
+        """
+        return len(self.buffer) + self.page_spans.nbytes
+
+    def to_dict(self) -> dict:
+        """
+        Serialise the document's metadata; the text buffer is saved with the chunk store.
+
+        Returns:
+            dict: Filename and page byte spans.
+        """
+        return {"filename": self.filename, "page_spans": self.page_spans.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: dict, buffer) -> "ParsedDocument":
+        """
+        Rebuild a document from `to_dict` output and its text buffer.
+
+        Args:
+            data (dict): Serialised document metadata.
+            buffer (bytes | np.memmap): UTF-8 document text.
+
+        Returns:
+            ParsedDocument: The restored document.
+        """
+        return cls.from_buffer(data["filename"], buffer, data["page_spans"])
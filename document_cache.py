@@ -0,0 +1,261 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+from bm25 import BM25Index
+from chunk_store import ChunkStore
+from document import ParsedDocument
+from embeddings import EMBEDDING_MODEL_NAME, CHUNK_SIZE, CHUNK_OVERLAP
+from faiss_index import FAISS_INDEX_MODE, save_index, load_index
+from summaries import SummaryTree
+
+# === Configuration ===
+CACHE_DIR = os.getenv("PDF_CACHE_DIR", "cache")
+CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", 2 * 1024 ** 3))  # 2 GB
+CACHE_VERSION = 5  # Bump to invalidate every entry after a format change
+
+META_FILE = "meta.json"
+DATA_FILE = "document.json"  # Filename and page spans
+CHUNKS_DIR = "chunks"         # Document text buffer and chunk arrays, memory-mapped on load
+INDEX_FILE = "index.faiss"  # Raw FAISS index, memory-mapped on load
+BM25_DIR = "bm25"           # BM25 posting arrays, memory-mapped on load
+SUMMARIES_FILE = "summaries.json"  # Summary tree, added by a background build after the entry
+
+
+def new_hasher():
+    """
+    Return an incremental hasher that yields the same digest as `hash_bytes`.
+
+    Returns:
+        hashlib._Hash: SHA-256 hasher; feed it with update() and read hexdigest().
+    """
+    return hashlib.sha256()
+
+
+def hash_bytes(data: bytes) -> str:
+    """
+    Compute the content address of an uploaded file.
+
+    Args:
+        data (bytes): Raw file contents.
+
+    Returns:
+        str: Hex-encoded SHA-256 digest.
+    """
+    hasher = new_hasher()
+    hasher.update(data)
+    return hasher.hexdigest()
+
+
+def settings_fingerprint() -> dict:
+    """
+    Return the settings that cached artifacts depend on.
+
+    An entry written under different settings is treated as stale.
+
+    Returns:
+        dict: Cache format version, embedding model, chunking parameters and index mode.
+    """
+    return {
+        "version": CACHE_VERSION,
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "index_mode": FAISS_INDEX_MODE,
+    }
+
+
+def _entry_dir(doc_hash: str) -> str:
+    return os.path.join(CACHE_DIR, doc_hash)
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def invalidate(doc_hash: str = None):
+    """
+    Remove one cache entry, or the whole cache when no hash is given.
+
+    Args:
+        doc_hash (str, optional): Content hash of the entry to remove.
+    """
+    target = _entry_dir(doc_hash) if doc_hash else CACHE_DIR
+    shutil.rmtree(target, ignore_errors=True)
+    print(f"[CACHE] Invalidated {'entry ' + doc_hash if doc_hash else 'all entries'}")
+
+
+def load_document(doc_hash: str):
+    """
+    Load cached extraction results and indexes for a document.
+
+    The document text, chunk arrays, FAISS index and BM25 arrays are
+    memory-mapped read-only, so every worker process on the host shares one
+    physical copy of them.
+
+    Args:
+        doc_hash (str): Content hash of the uploaded PDF.
+
+    Returns:
+        dict | None: 'document', 'chunks', 'index', 'bm25' and 'summaries'
+        (None until built), or None on a miss.
+    """
+    entry = _entry_dir(doc_hash)
+    meta_path = os.path.join(entry, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        if meta.get("settings") != settings_fingerprint():
+            print(f"[CACHE] Stale entry for {doc_hash[:12]} — settings changed")
+            invalidate(doc_hash)
+            return None
+
+        with open(os.path.join(entry, DATA_FILE), "r", encoding="utf-8") as f:
+            document_data = json.load(f)
+
+        chunks = ChunkStore.load(os.path.join(entry, CHUNKS_DIR))
+        document = ParsedDocument.from_dict(document_data, chunks.buffer)
+        data = {
+            "document": document,
+            "chunks": chunks,
+            "index": load_index(os.path.join(entry, INDEX_FILE)),
+            "bm25": BM25Index.load(os.path.join(entry, BM25_DIR)),
+            "summaries": load_summaries(doc_hash),
+        }
+
+        # Touch the entry so eviction treats it as recently used
+        os.utime(meta_path, None)
+        print(f"[CACHE] Hit for {doc_hash[:12]}")
+        return data
+
+    except Exception as e:
+        # Not invalidated: another worker may be replacing this entry right now,
+        # and a genuinely broken entry is overwritten by the next ingestion
+        print(f"[CACHE] Failed to load entry {doc_hash[:12]}: {e}")
+        return None
+
+
+def save_document(doc_hash: str, document: ParsedDocument, chunks: ChunkStore, index, bm25: BM25Index):
+    """
+    Persist extraction results and the FAISS and BM25 indexes for a document.
+
+    Entries are complete, self-describing artifacts: any worker process can
+    load a document another worker ingested.
+
+    Args:
+        doc_hash (str): Content hash of the uploaded PDF.
+        document (ParsedDocument): Parsed document sharing `chunks`' text buffer.
+        chunks (ChunkStore): Chunk store; its buffer holds the document text.
+        index (faiss.Index): Index over the chunk vectors, saved alongside the data.
+        bm25 (BM25Index): Lexical index over the same chunks.
+    """
+    entry = _entry_dir(doc_hash)
+    tmp_entry = f"{entry}.tmp-{uuid.uuid4().hex}"  # Unique per save, even within one process
+
+    try:
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        os.makedirs(tmp_entry, exist_ok=True)
+
+        with open(os.path.join(tmp_entry, DATA_FILE), "w", encoding="utf-8") as f:
+            json.dump(document.to_dict(), f)
+        chunks.save(os.path.join(tmp_entry, CHUNKS_DIR))
+
+        save_index(index, os.path.join(tmp_entry, INDEX_FILE))
+        bm25.save(os.path.join(tmp_entry, BM25_DIR))
+
+        # Meta is written last: its presence marks a complete entry
+        with open(os.path.join(tmp_entry, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"settings": settings_fingerprint(), "created": time.time()}, f)
+
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp_entry, entry)
+        print(f"[CACHE] Stored entry {doc_hash[:12]}")
+
+    except Exception as e:
+        print(f"[CACHE] Failed to store entry {doc_hash[:12]}: {e}")
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        return
+
+    evict(keep=doc_hash)
+
+
+def save_summaries(doc_hash: str, summaries: dict):
+    """
+    Add a summary tree to an existing cache entry.
+
+    Args:
+        doc_hash (str): Content hash of the uploaded PDF.
+        summaries (dict): Serialised SummaryTree.
+    """
+    entry = _entry_dir(doc_hash)
+    if not os.path.exists(os.path.join(entry, META_FILE)):
+        print(f"[CACHE] No entry for {doc_hash[:12]}; summaries not stored")
+        return
+
+    path = os.path.join(entry, SUMMARIES_FILE)
+    try:
+        tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(summaries, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[CACHE] Failed to store summaries for {doc_hash[:12]}: {e}")
+
+
+def load_summaries(doc_hash: str):
+    """
+    Load a cache entry's summary tree, if one has been built.
+
+    Args:
+        doc_hash (str): Content hash of the uploaded PDF.
+
+    Returns:
+        SummaryTree | None: The tree, or None if absent or unreadable.
+    """
+    try:
+        with open(os.path.join(_entry_dir(doc_hash), SUMMARIES_FILE), "r", encoding="utf-8") as f:
+            return SummaryTree.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def evict(keep: str = None):
+    """
+    Delete least-recently-used entries until the cache fits in CACHE_MAX_BYTES.
+
+    Args:
+        keep (str, optional): Hash of an entry that must not be evicted.
+    """
+    if not os.path.isdir(CACHE_DIR):
+        return
+
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        meta_path = os.path.join(path, META_FILE)
+        if not os.path.exists(meta_path):
+            continue
+        entries.append((os.path.getmtime(meta_path), name, _dir_size(path)))
+
+    total = sum(size for _, _, size in entries)
+    for _, name, size in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        if name == keep:
+            continue
+        invalidate(name)
+        total -= size
@@ -0,0 +1,176 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from metrics import EMBEDDING_CACHE_LOOKUPS
+
+# === Configuration ===
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join("embedding_cache", "embeddings.sqlite3"))  # "" disables
+CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", 500_000))  # ~1.5 KB per MiniLM vector
+QUERY_BATCH = 500  # Keys per SELECT, below SQLite's bound-parameter limit
+EVICT_TO_FRACTION = 0.9  # Trim to this share of CACHE_MAX_ROWS, so counting and trimming are rare
+
+_local = threading.local()  # Per-thread connection and the path it was opened for
+_state_lock = threading.Lock()
+_row_counts: Dict[str, int] = {}  # Database path -> rows, counted at setup and tracked per insert
+
+
+def chunk_key(text: str, model_name: str) -> str:
+    """
+    Return the cache key for a chunk embedded with a given model.
+
+    Args:
+        text (str): Chunk text.
+        model_name (str): Embedding model name.
+
+    Returns:
+        str: Hex-encoded SHA-256 of the model name and text.
+    """
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+def _setup(path: str) -> int:
+    # Once per database per process: WAL mode and schema, then the starting row count
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, created REAL NOT NULL)"
+        )
+        # Eviction deletes oldest-first; without this every trim is a full scan and sort
+        conn.execute("CREATE INDEX IF NOT EXISTS embeddings_created ON embeddings (created)")
+        conn.commit()
+        (rows,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return rows
+    finally:
+        conn.close()
+
+
+def _connect() -> sqlite3.Connection:
+    """
+    Return this thread's connection to CACHE_PATH, opening it on first use.
+
+    Returns:
+        sqlite3.Connection: Connection reused by later calls on the same thread.
+    """
+    path = CACHE_PATH
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == path:
+        return conn
+    if conn is not None:
+        conn.close()
+
+    with _state_lock:
+        if path not in _row_counts:
+            _row_counts[path] = _setup(path)
+    conn = sqlite3.connect(path, timeout=30)
+    _local.conn, _local.path = conn, path
+    return conn
+
+
+def _reset():
+    # Drop this thread's connection after an error so the next call reconnects
+    conn = getattr(_local, "conn", None)
+    _local.conn = None
+    if conn is not None:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+def _trim(conn: sqlite3.Connection, path: str):
+    """
+    Delete the oldest rows down to EVICT_TO_FRACTION of CACHE_MAX_ROWS.
+
+    The table is counted here, not on every insert: other worker processes
+    write to the same database, so the local count is only an estimate.
+    """
+    with conn:
+        (rows,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if rows > CACHE_MAX_ROWS:
+            target = int(CACHE_MAX_ROWS * EVICT_TO_FRACTION)
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY created LIMIT ?)",
+                (rows - target,),
+            )
+            rows = target
+    with _state_lock:
+        _row_counts[path] = rows
+
+
+def get_many(keys: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Look up cached vectors.
+
+    Args:
+        keys (List[str]): Keys from `chunk_key`.
+
+    Returns:
+        Dict[str, np.ndarray]: float32 vectors for the keys that were found.
+    """
+    if not CACHE_PATH or not keys:
+        return {}
+
+    found = {}
+    unique = list(dict.fromkeys(keys))
+    try:
+        conn = _connect()
+        for start in range(0, len(unique), QUERY_BATCH):
+            batch = unique[start:start + QUERY_BATCH]
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+    except sqlite3.Error as e:
+        print(f"[EMBED CACHE] Lookup failed: {e}")
+        _reset()
+        return {}
+
+    EMBEDDING_CACHE_LOOKUPS.labels("hit").inc(len(found))
+    EMBEDDING_CACHE_LOOKUPS.labels("miss").inc(len(unique) - len(found))
+    return found
+
+
+def put_many(vectors: Dict[str, np.ndarray]):
+    """
+    Store vectors, then drop the oldest rows if the cache is over CACHE_MAX_ROWS.
+
+    Keys are content hashes, so an existing row already holds the same vector
+    and is left as is.
+
+    Args:
+        vectors (Dict[str, np.ndarray]): Vectors keyed by `chunk_key`.
+    """
+    if not CACHE_PATH or not vectors:
+        return
+
+    now = time.time()
+    try:
+        conn = _connect()
+        path = _local.path
+        with conn:
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, created) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in vectors.items()],
+            )
+        with _state_lock:
+            _row_counts[path] += max(cursor.rowcount, 0)
+            over = _row_counts[path] > CACHE_MAX_ROWS
+        if over:
+            _trim(conn, path)
+    except sqlite3.Error as e:
+        print(f"[EMBED CACHE] Store failed: {e}")
+        _reset()
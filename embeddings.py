@@ -1,111 +1,382 @@
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.docstore.document import Document
-import fitz  # PyMuPDF
+import numpy as np
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-from shared_state import shared_state
+from document import ParsedDocument, PAGE_SEPARATOR
+from pdf_reader import parse_pdf
+from faiss_index import build_index
+from metrics import span
+import embedding_cache
+
+# === Configuration ===
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+CHUNK_SIZE = 400
+CHUNK_OVERLAP = 75
+EMBED_BATCH_SIZE = 64  # Chunks encoded per call, also the progress granularity
+
+# === Process-wide embedding provider ===
+_embeddings_model = None
+_embeddings_lock = threading.Lock()
+_embeddings_load_time = None  # Seconds spent loading + warming the model
 
 
 def get_embeddings():
     """
-    Load and return a HuggingFace sentence-transformer embedding model.
+    Return the process-wide HuggingFace sentence-transformer embedding model.
+
+    The model is loaded on first use and shared by ingestion and query-time
+    search, so later calls return immediately.
 
     Returns:
         HuggingFaceEmbeddings: Embedding model for encoding text.
     """
-    print("[INFO] Loading HuggingFace embeddings: all-MiniLM-L6-v2")
-    return HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    global _embeddings_model, _embeddings_load_time
+
+    if _embeddings_model is not None:
+        return _embeddings_model
+
+    with _embeddings_lock:
+        if _embeddings_model is None:
+            print(f"[INFO] Loading HuggingFace embeddings: {EMBEDDING_MODEL_NAME}")
+            start_time = time.time()
+            model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+            # Run one encode so lazy weights and tokenizer are initialised
+            model.embed_query("warmup")
+            _embeddings_load_time = time.time() - start_time
+            _embeddings_model = model
+            print(f"[INFO] Embeddings ready in {_embeddings_load_time:.2f}s")
+
+    return _embeddings_model
 
 
-def chunk_text(input_data: str) -> list:
+@lru_cache(maxsize=1024)
+def embed_query(text: str) -> Tuple[float, ...]:
     """
-    Split the given input (PDF path or raw text) into overlapping text chunks.
+    Embed a query with the shared model, memoising repeated texts.
+
+    The router and answer cache embed the same question; this keeps it to one encode.
 
     Args:
-        input_data (str): Either plain text or a PDF file path.
+        text (str): Query text.
 
     Returns:
-        list: List of chunk dictionaries with 'content' and 'metadata'.
+        Tuple[float, ...]: Query embedding.
+    """
+    return tuple(get_embeddings().embed_query(text))
+
+
+def embeddings_status() -> dict:
     """
-    chunks = []
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=400,
-        chunk_overlap=75,
+    Report whether the shared embedding model is loaded.
+
+    Returns:
+        dict: Model name, readiness flag and load time in seconds.
+    """
+    return {
+        "model": EMBEDDING_MODEL_NAME,
+        "ready": _embeddings_model is not None,
+        "load_time_seconds": round(_embeddings_load_time, 2) if _embeddings_load_time is not None else None,
+    }
+
+
+def _make_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
         separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""],
         length_function=len
     )
 
-    if input_data.lower().endswith(".pdf"):
+
+def _split_with_offsets(splitter, text: str) -> Iterator[Tuple[str, int, int]]:
+    """
+    Split text and locate each stripped chunk in it.
+
+    Args:
+        splitter (RecursiveCharacterTextSplitter): Configured splitter.
+        text (str): Text to split.
+
+    Yields:
+        Tuple[str, int, int]: Chunk text and its start and end offsets in `text`.
+    """
+    search_from = 0
+    previous_length = 0
+    for split in splitter.split_text(text):
+        # Same search LangChain uses for add_start_index: resume just past the overlap
+        start = text.find(split, max(0, search_from + previous_length - CHUNK_OVERLAP))
+        if start < 0:
+            start = text.find(split)
+        search_from, previous_length = max(start, 0), len(split)
+
+        cleaned = split.strip()
+        if not cleaned or start < 0:
+            continue
+        start += len(split) - len(split.lstrip())
+        yield cleaned, start, start + len(cleaned)
+
+
+def iter_chunks(pages: Iterable[Tuple[Union[int, str], str]], progress: Optional[Callable] = None) -> Iterator[dict]:
+    """
+    Chunk pages lazily as they are produced, keeping page and offset provenance.
+
+    Offsets are byte positions in the document's UTF-8 text buffer
+    (`ParsedDocument.buffer`), so `buffer[start:end]` is the chunk and
+    neighbouring chunks can be merged.
+
+    Args:
+        pages (Iterable[Tuple[int, str]]): (1-based page number, page text) in page order.
+        progress (Callable, optional): Called as progress("chunk", total=chunks_so_far) after each page.
+
+    Yields:
+        dict: Chunk with 'content' and 'metadata' ('page', 'start', 'end').
+    """
+    splitter = _make_splitter()
+    offset = 0
+    seen_text = False
+    chunks_so_far = 0
+    for page_number, text in pages:
+        if not text:
+            continue
+        if seen_text:
+            offset += len(PAGE_SEPARATOR.encode("utf-8"))
+        seen_text = True
+        page_offset = offset
+        ascii_only = text.isascii()
+        offset += len(text) if ascii_only else len(text.encode("utf-8"))
+
+        def byte_offset(char_offset: int) -> int:
+            return char_offset if ascii_only else len(text[:char_offset].encode("utf-8"))
+
+        if len(text) < 20:
+            print(f"[WARN] Skipping page {page_number} — empty or too short")
+            continue
+
+        with span("chunk"):
+            page_chunks = [
+                {
+                    "content": content,
+                    "metadata": {
+                        "page": page_number,
+                        "start": page_offset + byte_offset(start),
+                        "end": page_offset + byte_offset(end),
+                    },
+                }
+                for content, start, end in _split_with_offsets(splitter, text)
+            ]
+        chunks_so_far += len(page_chunks)
+        if progress:
+            progress("chunk", total=chunks_so_far)
+        yield from page_chunks
+
+
+def chunk_text(input_data) -> list:
+    """
+    Split the given input (parsed document, PDF path or raw text) into overlapping text chunks.
+
+    Parsed documents are chunked page by page so every chunk keeps its page number.
+
+    Args:
+        input_data (ParsedDocument | str): A parsed document, a PDF file path or plain text.
+
+    Returns:
+        list: List of chunk dictionaries with 'content' and 'metadata'.
+    """
+    if isinstance(input_data, str) and input_data.lower().endswith(".pdf"):
         print(f"[INFO] Chunking PDF: {input_data}")
-        try:
-            doc = fitz.open(input_data)
-            shared_state.page_count = len(doc)
-
-            for i, page in enumerate(doc):
-                text = page.get_text().strip()
-                if not text or len(text) < 20:
-                    print(f"[WARN] Skipping page {i + 1} — empty or too short")
-                    continue
-
-                splits = splitter.split_text(text)
-                for chunk in splits:
-                    cleaned = chunk.strip()
-                    if cleaned:
-                        chunks.append({
-                            "content": cleaned,
-                            "metadata": {"page": i + 1}
-                        })
-
-        except Exception as e:
-            print(f"[ERROR] Failed to open PDF: {e}")
-            raise e
+        input_data = parse_pdf(input_data)
 
+    if isinstance(input_data, ParsedDocument):
+        chunks = list(iter_chunks(enumerate(input_data.pages, start=1)))
     else:
         print("[INFO] Chunking plain text input")
-        text = input_data.strip()
-        splits = splitter.split_text(text)
-        for chunk in splits:
-            cleaned = chunk.strip()
-            if cleaned:
-                chunks.append({
-                    "content": cleaned,
-                    "metadata": {"page": "unknown"}
-                })
+        chunks = list(iter_chunks([("unknown", input_data.strip())]))
 
     print(f"[INFO] Total chunks created: {len(chunks)}")
-    shared_state.chunks = chunks
     return chunks
 
 
-def build_vectorstore(chunks: list, embeddings_model) -> FAISS:
+def embed_texts(texts: List[str], embeddings_model) -> np.ndarray:
     """
-    Build a FAISS vectorstore from the given text chunks using the specified embedding model.
+    Embed a batch of chunk texts, reusing vectors from the embedding cache.
 
     Args:
-        chunks (list): List of dicts with 'content' and 'metadata'.
+        texts (List[str]): Chunk texts.
+        embeddings_model (Embeddings): Model used for cache misses.
+
+    Returns:
+        np.ndarray: float32 array of shape (len(texts), d).
+    """
+    model_name = getattr(embeddings_model, "model_name", EMBEDDING_MODEL_NAME)
+    keys = [embedding_cache.chunk_key(text, model_name) for text in texts]
+    with span("embed_cache_lookup"):
+        vectors = embedding_cache.get_many(keys)
+
+    # Encode each distinct missing text once
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in vectors:
+            missing.setdefault(key, text)
+    vectors.update(_encode_missing(missing, embeddings_model))
+
+    return np.stack([vectors[key] for key in keys]).astype("float32", copy=False)
+
+
+def _encode_missing(missing: Dict[str, str], embeddings_model) -> Dict[str, np.ndarray]:
+    """
+    Encode cache misses in one model call and store them in the embedding cache.
+
+    Args:
+        missing (Dict[str, str]): Chunk text keyed by `embedding_cache.chunk_key`.
+        embeddings_model (Embeddings): Model to encode with.
+
+    Returns:
+        Dict[str, np.ndarray]: float32 vectors by key.
+    """
+    if not missing:
+        return {}
+    with span("embed_batch"):
+        encoded = embeddings_model.embed_documents(list(missing.values()))
+    new_vectors = {key: np.asarray(vector, dtype="float32") for key, vector in zip(missing, encoded)}
+    embedding_cache.put_many(new_vectors)
+    return new_vectors
+
+
+def embed_chunks(
+    chunks: Iterable[dict],
+    embeddings_model,
+    progress: Optional[Callable] = None,
+    total: Optional[int] = None,
+    keep_content: bool = True,
+) -> Tuple[List[dict], np.ndarray]:
+    """
+    Embed chunks in fixed-size batches as they arrive.
+
+    Accepts a generator, so embedding overlaps with extraction and chunking
+    upstream. Each batch is looked up in the embedding cache as it arrives;
+    misses are pooled across batches and encoded EMBED_BATCH_SIZE at a time,
+    so a lightly edited document still sends full batches to the model.
+
+    Args:
+        chunks (Iterable[dict]): Chunk dictionaries, e.g. from `iter_chunks`.
         embeddings_model (Embeddings): The embeddings model to use.
+        progress (Callable, optional): Called as progress("embed", done, total) after each
+            batch, where `done` counts chunks whose vectors are ready.
+        total (int, optional): Expected chunk count, for progress reporting.
+        keep_content (bool): Return each chunk's text. When False only 'metadata' is
+            kept once a chunk is embedded, so memory stays bounded by the batch size
+            (the offsets point into the document buffer).
 
     Returns:
-        FAISS: An in-memory FAISS vector store ready for similarity search.
+        Tuple[List[dict], np.ndarray]: The chunks, in order, and their float32 vectors.
     """
-    print("[INFO] Building FAISS vectorstore...")
+    model_name = getattr(embeddings_model, "model_name", EMBEDDING_MODEL_NAME)
+    collected: List[dict] = []
+    vectors: List[Optional[np.ndarray]] = []  # One slot per chunk, filled once encoded
+    batch: List[dict] = []
+    missing: Dict[str, str] = {}           # Cache misses awaiting encoding, by key
+    waiting: List[Tuple[int, str]] = []    # (slot, key) to fill from `missing`
 
-    documents = [
-        Document(page_content=chunk["content"], metadata=chunk["metadata"])
-        for chunk in chunks
-    ]
+    def encode_missing():
+        encoded = _encode_missing(missing, embeddings_model)
+        for slot, key in waiting:
+            vectors[slot] = encoded[key]
+        missing.clear()
+        waiting.clear()
 
-    try:
-        vectorstore = FAISS.from_documents(documents, embeddings_model)
-        print(f"[SUCCESS] FAISS store created with {len(documents)} documents.")
+    def flush():
+        keys = [embedding_cache.chunk_key(chunk["content"], model_name) for chunk in batch]
+        with span("embed_cache_lookup"):
+            found = embedding_cache.get_many(keys)
+        for chunk, key in zip(batch, keys):
+            if key not in found:
+                missing.setdefault(key, chunk["content"])
+                waiting.append((len(vectors), key))
+            vectors.append(found.get(key))
+        if keep_content:
+            collected.extend(batch)
+        else:
+            collected.extend({"metadata": chunk["metadata"]} for chunk in batch)
+        batch.clear()
+        if len(missing) >= EMBED_BATCH_SIZE:
+            encode_missing()
+        if progress:
+            progress("embed", len(collected) - len(waiting), total)
+
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= EMBED_BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+    encode_missing()
+    if progress:
+        progress("embed", len(collected), total)
 
-        # Save references globally
-        shared_state.vectorstore = vectorstore
-        shared_state.embeddings_model = embeddings_model
+    if not vectors:
+        return collected, np.empty((0, 0), dtype="float32")
+    return collected, np.stack(vectors).astype("float32", copy=False)
 
-        return vectorstore
+
+def index_chunks(
+    vectors: np.ndarray,
+    progress: Optional[Callable] = None,
+    index_mode: Optional[str] = None,
+):
+    """
+    Build the FAISS index for already-embedded chunks.
+
+    Row i of the index is the vector at position i of `vectors`; the chunk
+    store maps rows back to chunks, so no docstore is kept alongside.
+
+    Args:
+        vectors (np.ndarray): float32 array of shape (len(chunks), d), in chunk order.
+        progress (Callable, optional): Called as progress("index") before building.
+        index_mode (str, optional): flat, hnsw, ivfpq or auto (see faiss_index.FAISS_INDEX_MODE).
+
+    Returns:
+        faiss.Index: Index over the chunk vectors.
+    """
+    if progress:
+        progress("index")
+    with span("faiss_build"):
+        index = build_index(vectors, index_mode)
+    print(f"[SUCCESS] FAISS index created with {index.ntotal} vectors.")
+    return index
+
+
+def build_chunk_index(
+    chunks: list,
+    embeddings_model,
+    progress: Optional[Callable] = None,
+    index_mode: Optional[str] = None,
+):
+    """
+    Build a FAISS index from the given text chunks using the specified embedding model.
+
+    Chunks are embedded in batches of EMBED_BATCH_SIZE (see `embed_chunks`);
+    vectors for chunk texts seen before come from the persistent embedding
+    cache. Everything is then indexed in one step.
+    The index type (flat, HNSW or IVF-PQ) is chosen from the chunk count unless overridden.
+
+    Args:
+        chunks (list): List of dicts with 'content' and 'metadata'.
+        embeddings_model (Embeddings): The embeddings model to use.
+        progress (Callable, optional): Called as progress(stage, done, total) after each batch.
+        index_mode (str, optional): flat, hnsw, ivfpq or auto (see faiss_index.FAISS_INDEX_MODE).
+
+    Returns:
+        faiss.Index: In-memory index whose row i is chunk i.
+    """
+    print("[INFO] Building FAISS index...")
+
+    try:
+        _, vectors = embed_chunks(chunks, embeddings_model, progress, total=len(chunks))
+        return index_chunks(vectors, progress, index_mode)
 
     except Exception as e:
-        print(f"[ERROR] Failed to build vectorstore: {e}")
+        print(f"[ERROR] Failed to build FAISS index: {e}")
         raise e
@@ -0,0 +1,257 @@
+import argparse
+import math
+import os
+import time
+from typing import List, Optional
+
+import faiss
+import numpy as np
+
+# === Configuration ===
+FAISS_INDEX_MODE = os.getenv("FAISS_INDEX_MODE", "auto")  # auto | flat | hnsw | ivfpq
+HNSW_MIN_CHUNKS = 5_000     # Auto mode switches from flat to HNSW at this size
+IVFPQ_MIN_CHUNKS = 50_000   # ...and from HNSW to IVF-PQ at this size
+
+HNSW_M = 32                 # Graph neighbours per node
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+
+IVF_NPROBE = 16             # Inverted lists scanned per query
+PQ_SUBVECTORS = 48          # Must divide the embedding dimension (384 for MiniLM)
+PQ_BITS = 8
+PQ_MIN_TRAIN = 2 ** PQ_BITS  # PQ training fails with fewer vectors than codebook centroids
+
+INDEX_MODES = ["flat", "hnsw", "ivfpq"]
+
+# Map index storage instead of copying it, so worker processes share one physical
+# copy through the page cache. The flags depend on the index type, and combining
+# them fails: IO_FLAG_MMAP maps IVF inverted lists (but not flat storage), while
+# IO_FLAG_MMAP_IFC (newer faiss releases) maps flat and HNSW vector storage.
+IVF_MMAP_IO_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+FLAT_MMAP_IO_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+IVF_FOURCC_PREFIX = b"Iw"  # Serialised IVF indexes start with "IwFl", "IwPQ", "IwSq", ...
+if not hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+    print(
+        f"[WARN] faiss {getattr(faiss, '__version__', '?')} lacks IO_FLAG_MMAP_IFC: flat and HNSW indexes "
+        "are read into each worker's private memory instead of being shared. Upgrade faiss-cpu to share them."
+    )
+
+
+def choose_index_mode(num_vectors: int, mode: Optional[str] = None) -> str:
+    """
+    Pick an index mode from the collection size unless one is forced.
+
+    Args:
+        num_vectors (int): Number of chunk embeddings to index.
+        mode (str, optional): Explicit mode; falls back to FAISS_INDEX_MODE.
+
+    Returns:
+        str: One of INDEX_MODES.
+    """
+    mode = (mode or FAISS_INDEX_MODE).lower()
+    if mode in INDEX_MODES:
+        return mode
+    if mode != "auto":
+        print(f"[WARN] Unknown FAISS index mode '{mode}', using auto selection.")
+
+    if num_vectors >= IVFPQ_MIN_CHUNKS:
+        return "ivfpq"
+    if num_vectors >= HNSW_MIN_CHUNKS:
+        return "hnsw"
+    return "flat"
+
+
+def configure_search(index):
+    """
+    Apply query-time parameters, which are not always restored by `faiss.read_index`.
+
+    Args:
+        index (faiss.Index): Loaded or freshly built index.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = IVF_NPROBE
+
+
+def build_index(vectors: np.ndarray, mode: Optional[str] = None):
+    """
+    Build a FAISS index over the given embeddings.
+
+    Args:
+        vectors (np.ndarray): float32 array of shape (n, d).
+        mode (str, optional): flat, hnsw, ivfpq or auto.
+
+    Returns:
+        faiss.Index: Populated index using L2 distance, like LangChain's default.
+    """
+    num_vectors, dim = vectors.shape
+    mode = choose_index_mode(num_vectors, mode)
+
+    if mode == "ivfpq" and dim % PQ_SUBVECTORS != 0:
+        print(f"[WARN] Dimension {dim} not divisible by {PQ_SUBVECTORS}; using HNSW instead of IVF-PQ.")
+        mode = "hnsw"
+    if mode == "ivfpq" and num_vectors < PQ_MIN_TRAIN:
+        fallback = "hnsw" if num_vectors >= HNSW_MIN_CHUNKS else "flat"
+        print(f"[WARN] {num_vectors} vectors are too few to train IVF-PQ (need {PQ_MIN_TRAIN}); using {fallback}.")
+        mode = fallback
+
+    if mode == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif mode == "ivfpq":
+        # Roughly 4 * sqrt(n) lists, with enough points per list to train on
+        nlist = max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, PQ_SUBVECTORS, PQ_BITS)
+        start_time = time.time()
+        index.train(vectors)
+        print(f"[INFO] Trained IVF-PQ ({nlist} lists) in {time.time() - start_time:.2f}s")
+    else:
+        index = faiss.IndexFlatL2(dim)
+
+    index.add(vectors)
+    configure_search(index)
+    print(f"[INFO] Built {mode} FAISS index over {num_vectors} vectors.")
+    return index
+
+
+def save_index(index, path: str):
+    """
+    Write an index to a single file that `load_index` can memory-map.
+
+    Args:
+        index (faiss.Index): Index built by `build_index`.
+        path (str): Destination file.
+    """
+    faiss.write_index(index, path)
+
+
+def mmap_io_flags(path: str) -> int:
+    """
+    Pick the read flags that memory-map a saved index of the given type.
+
+    Args:
+        path (str): Index file written by `save_index`.
+
+    Returns:
+        int: FAISS IO flags for `faiss.read_index`.
+    """
+    with open(path, "rb") as f:
+        fourcc = f.read(4)
+    return IVF_MMAP_IO_FLAGS if fourcc.startswith(IVF_FOURCC_PREFIX) else FLAT_MMAP_IO_FLAGS
+
+
+def load_index(path: str, mmap: bool = True):
+    """
+    Load an index written by `save_index`, memory-mapped where FAISS supports it.
+
+    Args:
+        path (str): Index file.
+        mmap (bool): Map the file read-only instead of reading it into private memory.
+
+    Returns:
+        faiss.Index: Index ready for search.
+    """
+    if mmap:
+        try:
+            index = faiss.read_index(path, mmap_io_flags(path))
+        except RuntimeError as e:
+            print(f"[WARN] Could not memory-map {path}; reading a private copy into memory: {e}")
+            index = faiss.read_index(path)
+    else:
+        index = faiss.read_index(path)
+    configure_search(index)
+    return index
+
+
+def index_size_bytes(index) -> int:
+    """
+    Approximate the RAM held by a FAISS index.
+
+    Args:
+        index (faiss.Index): Any index built by `build_index`.
+
+    Returns:
+        int: Estimated size in bytes.
+    """
+    if isinstance(index, faiss.IndexIVFPQ):
+        # Codes plus 8-byte ids, plus the coarse centroids
+        return index.ntotal * (index.pq.code_size + 8) + index.nlist * index.d * 4
+    if isinstance(index, faiss.IndexHNSW):
+        return index.ntotal * (index.d * 4 + index.hnsw.nb_neighbors(0) * 4)
+    return index.ntotal * index.d * 4
+
+
+def compare_index_modes(vectors: np.ndarray, k: int = 10, num_queries: int = 200, modes: List[str] = None) -> List[dict]:
+    """
+    Measure recall@k and query latency of each mode against the exact flat index.
+
+    Queries are sampled from the indexed vectors themselves.
+
+    Args:
+        vectors (np.ndarray): float32 array of shape (n, d).
+        k (int): Neighbours retrieved per query.
+        num_queries (int): Number of sampled queries.
+        modes (List[str], optional): Modes to evaluate; defaults to all.
+
+    Returns:
+        List[dict]: Per-mode recall, mean latency, build time and estimated size.
+    """
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)]
+    k = min(k, len(vectors))
+
+    report = []
+    exact_ids = None
+    for mode in ["flat"] + [m for m in (modes or INDEX_MODES) if m != "flat"]:
+        if mode == "ivfpq" and len(vectors) < PQ_MIN_TRAIN:
+            print(f"[WARN] Skipping ivfpq: {len(vectors)} vectors are too few to train it.")
+            continue
+        start_time = time.time()
+        index = build_index(vectors, mode)
+        build_time = time.time() - start_time
+
+        start_time = time.time()
+        _, ids = index.search(queries, k)
+        latency_ms = (time.time() - start_time) * 1000 / len(queries)
+
+        if exact_ids is None:
+            exact_ids = ids
+        recall = np.mean([
+            len(set(found) & set(exact)) / k for found, exact in zip(ids, exact_ids)
+        ])
+
+        report.append({
+            "mode": mode,
+            "recall_at_k": round(float(recall), 4),
+            "query_latency_ms": round(latency_ms, 4),
+            "build_time_seconds": round(build_time, 2),
+            "size_bytes": index_size_bytes(index),
+        })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall vs latency of FAISS index modes against a flat index.")
+    parser.add_argument("--synthetic", type=int, default=0, help="Number of random clustered vectors to generate")
+    parser.add_argument("--doc", help="Content hash of a cached document whose chunks are re-embedded")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.doc:
+        from chunk_store import ChunkStore
+        from document_cache import CACHE_DIR, CHUNKS_DIR
+        from embeddings import get_embeddings
+
+        texts = list(ChunkStore.load(os.path.join(CACHE_DIR, args.doc, CHUNKS_DIR)).texts())
+        data = np.asarray(get_embeddings().embed_documents(texts), dtype="float32")
+    else:
+        count = args.synthetic or 20_000
+        rng = np.random.default_rng(42)
+        centres = rng.normal(size=(max(1, count // 100), 384))
+        data = (centres[rng.integers(len(centres), size=count)] + 0.3 * rng.normal(size=(count, 384))).astype("float32")
+
+    for row in compare_index_modes(data, k=args.k, num_queries=args.queries):
+        print(row)
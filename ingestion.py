@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from pdf_reader import iter_pages
+from document import ParsedDocument
+from chunk_store import ChunkStore
+from embeddings import iter_chunks, embed_chunks, index_chunks, get_embeddings
+from shared_state import state_registry, DocumentState
+from bm25 import BM25Index
+from metrics import span
+from summaries import schedule_summaries
+import document_cache
+
+# doc_hash -> [lock, holders]: one pipeline per document at a time
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+@contextmanager
+def _ingesting(doc_hash: str):
+    """
+    Serialise ingestion of the same document.
+
+    A second upload of a PDF that is still being ingested waits here, then
+    takes the fast path instead of building the same indexes again.
+
+    Args:
+        doc_hash (str): Content hash of the PDF.
+    """
+    with _inflight_lock:
+        entry = _inflight.setdefault(doc_hash, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _inflight_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _inflight[doc_hash]
+
+
+def ingest_pdf(file_path: str, doc_hash: str, job, session_id: str, filename: str = None, summarize=None) -> dict:
+    """
+    Run the full ingestion pipeline for an uploaded PDF.
+
+    Intended to run in a worker thread. Progress is reported through
+    `job.progress` and the document is activated for the session only once
+    its index is built.
+
+    Args:
+        file_path (str): Path to the saved PDF.
+        doc_hash (str): Content hash of the PDF, used as the document id and cache key.
+        job (Job): Job record that receives progress updates.
+        session_id (str): Session that uploaded the document.
+        filename (str, optional): Original name of the upload; defaults to the file's name.
+        summarize (Callable[[str, str], str], optional): Summariser for the background
+            summary tree build; no tree is built without one.
+
+    Returns:
+        dict: Metadata about the ingestion, such as chunk count, page count, and processing time.
+    """
+    with _ingesting(doc_hash):
+        return _ingest(file_path, doc_hash, job, session_id, filename, summarize)
+
+
+def _ingest(file_path: str, doc_hash: str, job, session_id: str, filename: str, summarize) -> dict:
+    start_time = time.time()
+    embeddings_model = get_embeddings()
+
+    # Fast path: document already resident or processed with the current settings
+    doc_state = state_registry.get_document(doc_hash)
+    if doc_state:
+        state_registry.activate(session_id, doc_hash)
+        job.pages_done = job.pages_total = doc_state.page_count
+        job.progress("index")
+        if summarize:
+            schedule_summaries(doc_state, summarize)
+
+        return {
+            "filename": doc_state.uploaded_filename,
+            "doc_id": doc_hash,
+            "message": "PDF loaded from cache.",
+            "num_chunks": len(doc_state.chunks),
+            "page_count": doc_state.page_count,
+            "cached": True,
+            "processing_time_seconds": round(time.time() - start_time, 2)
+        }
+
+    # Steps 1-2: Extract, chunk and embed as a stream, so chunks from early pages
+    # are embedded while later pages are still being read or OCR'd. Only chunk
+    # offsets are kept once embedded; the page texts become the document buffer
+    job.progress("extract")
+    pages = []
+
+    def extracted_pages():
+        for page_number, text in iter_pages(file_path, job.progress):
+            pages.append(text)
+            yield page_number, text
+
+    chunk_dicts, vectors = embed_chunks(
+        iter_chunks(extracted_pages(), job.progress), embeddings_model, job.progress, keep_content=False
+    )
+    if not chunk_dicts:
+        return {"error": "No readable text found in the PDF."}
+
+    # Keep the text once: chunks become byte ranges into the document's buffer
+    document = ParsedDocument(filename or os.path.basename(file_path), pages)
+    chunks = ChunkStore.from_chunks(chunk_dicts, document.buffer)
+    del pages[:], chunk_dicts
+
+    # Step 3: Build the vector and BM25 indexes
+    index = index_chunks(vectors, job.progress)
+    with span("bm25_build"):
+        bm25 = BM25Index(chunks.texts())
+
+    # Persist first so the registry can evict and reload the document later
+    document_cache.save_document(doc_hash, document, chunks, index, bm25)
+
+    doc_state = DocumentState(doc_hash, document, chunks, index, embeddings_model, bm25)
+    state_registry.register_document(doc_state)
+    state_registry.activate(session_id, doc_hash)
+
+    # Step 4 (optional): Summarise chunks, pages and sections in the background;
+    # the document is already answerable while this runs
+    if summarize:
+        schedule_summaries(doc_state, summarize)
+
+    return {
+        "filename": document.filename,
+        "doc_id": doc_hash,
+        "message": "PDF uploaded and processed successfully.",
+        "num_chunks": len(chunks),
+        "page_count": document.page_count,
+        "cached": False,
+        "processing_time_seconds": round(time.time() - start_time, 2)
+    }
@@ -0,0 +1,206 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+# === Configuration ===
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))  # Concurrent ingestion pipelines
+MAX_TRACKED_JOBS = 200  # Finished jobs beyond this are forgotten, oldest first
+JOBS_DIR = os.getenv("JOBS_DIR", "jobs")  # Job snapshots readable by every worker process
+PERSIST_INTERVAL_SECONDS = 1.0  # Streaming stages interleave; limit snapshot writes on stage changes
+
+# Pipeline stages, in the order they run
+STAGES = ["queued", "extract", "ocr", "chunk", "embed", "index", "done"]
+
+# Counter pair each stage reports into: pages read, pages OCR'd, chunks produced and embedded
+STAGE_COUNTERS = {"extract": "pages", "ocr": "ocr_pages", "chunk": "chunks", "embed": "chunks"}
+
+
+class Job:
+    """
+    Progress record for one background ingestion run.
+    """
+
+    def __init__(self, filename: str):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.status = "queued"             # queued | running | done | failed
+        self.stage = "queued"              # One of STAGES
+        self.pages_done = 0
+        self.pages_total = 0
+        self.ocr_pages_done = 0
+        self.ocr_pages_total = 0
+        self.chunks_done = 0               # Chunks embedded
+        self.chunks_total = 0              # Chunks produced so far
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self._persisted = 0.0
+
+    def progress(self, stage: str, done: int = None, total: int = None):
+        """
+        Record progress reported by one pipeline stage.
+
+        Used as the `progress` callback threaded through the ingestion pipeline.
+        Extraction, OCR, chunking and embedding run interleaved, so the job's
+        stage only moves forward, to the furthest stage reached, and each stage
+        updates its own counters (see STAGE_COUNTERS).
+
+        Args:
+            stage (str): Reporting pipeline stage.
+            done (int, optional): Units completed in this stage.
+            total (int, optional): Units expected in this stage.
+        """
+        advanced = STAGES.index(stage) > STAGES.index(self.stage)
+        if advanced:
+            self.stage = stage
+        counter = STAGE_COUNTERS.get(stage)
+        if counter and done is not None:
+            setattr(self, f"{counter}_done", done)
+        if counter and total is not None:
+            setattr(self, f"{counter}_total", total)
+        if advanced and time.time() - self._persisted >= PERSIST_INTERVAL_SECONDS:
+            self.persist()
+
+    def persist(self):
+        """
+        Write a snapshot for other worker processes; they see stage changes, not every page.
+        """
+        self._persisted = time.time()
+        try:
+            os.makedirs(JOBS_DIR, exist_ok=True)
+            path = os.path.join(JOBS_DIR, f"{self.id}.json")
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f)
+            os.replace(f"{path}.tmp", path)
+        except (OSError, TypeError) as e:
+            print(f"[Job {self.id[:8]}] Could not write snapshot: {e}")
+
+    def to_dict(self) -> dict:
+        """
+        Return a JSON-serialisable snapshot of the job.
+
+        Returns:
+            dict: Status, stage, progress counters, elapsed time and result or error.
+        """
+        end = self.finished or time.time()
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "pages_done": self.pages_done,
+            "pages_total": self.pages_total,
+            "ocr_pages_done": self.ocr_pages_done,
+            "ocr_pages_total": self.ocr_pages_total,
+            "chunks_done": self.chunks_done,
+            "chunks_total": self.chunks_total,
+            "elapsed_seconds": round(end - self.started, 2) if self.started else 0,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Run ingestion pipelines in a worker pool so they never block the event loop.
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, filename: str, fn: Callable[[Job], dict]) -> Job:
+        """
+        Queue a pipeline for background execution.
+
+        Args:
+            filename (str): Name of the uploaded file, for reporting.
+            fn (Callable[[Job], dict]): Pipeline to run; receives the job and returns its result.
+
+        Returns:
+            Job: The queued job.
+        """
+        job = Job(filename)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        job.persist()
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        Look up a job by id.
+
+        Args:
+            job_id (str): Job identifier returned by `submit`.
+
+        Returns:
+            Job | None: The job, or None if unknown or forgotten.
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def snapshot(self, job_id: str) -> Optional[dict]:
+        """
+        Describe a job, including jobs running in other worker processes.
+
+        Args:
+            job_id (str): Job identifier returned by `submit`.
+
+        Returns:
+            dict | None: Job snapshot, or None if unknown.
+        """
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(os.path.join(JOBS_DIR, f"{job_id}.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _run(self, job: Job, fn: Callable[[Job], dict]):
+        job.status = "running"
+        job.started = time.time()
+        job.persist()
+        try:
+            job.result = fn(job)
+            if job.result and job.result.get("error"):
+                job.status = "failed"
+                job.error = job.result["error"]
+            else:
+                job.status = "done"
+                job.stage = "done"
+        except Exception as e:
+            print(f"[Job {job.id[:8]} Failed]", e)
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+            job.persist()
+
+    def _trim(self):
+        while len(self._jobs) > MAX_TRACKED_JOBS:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.status in ("queued", "running"):
+                break
+            self._jobs.pop(oldest_id)
+            try:
+                os.remove(os.path.join(JOBS_DIR, f"{oldest_id}.json"))
+            except OSError:
+                pass
+
+
+# === Singleton instance ===
+job_manager = JobManager()
@@ -0,0 +1,292 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from metrics import LLM_QUEUE_SECONDS, LLM_COALESCED, LLM_TIMEOUTS
+
+# === Configuration ===
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # Keep the model (and its KV cache) loaded
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 1))  # Parallel generations sent to Ollama
+
+# Lower value = served first
+PRIORITY_CLASSIFY = 0    # Short label-only calls (intent, memory)
+PRIORITY_ANSWER = 1      # User-facing answers and agent steps
+PRIORITY_BACKGROUND = 2  # History summaries and other deferred work
+
+DEFAULT_TIMEOUTS = {
+    PRIORITY_CLASSIFY: 30,
+    PRIORITY_ANSWER: 180,
+    PRIORITY_BACKGROUND: 600,
+}
+
+
+class PrioritySemaphore:
+    """
+    Counting semaphore that hands free slots to the highest-priority waiter.
+
+    Waiters with equal priority are served first-come, first-served.
+    """
+
+    def __init__(self, slots: int):
+        self._slots = slots
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, priority: int, timeout: Optional[float] = None):
+        """
+        Wait for a slot.
+
+        Args:
+            priority (int): Lower values are served first.
+            timeout (float, optional): Seconds to wait before giving up.
+
+        Raises:
+            TimeoutError: If no slot became free in time.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            while not (self._slots > 0 and self._waiting[0] == entry):
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                    raise TimeoutError("Timed out waiting for an LLM slot.")
+                self._cond.wait(remaining)
+            heapq.heappop(self._waiting)
+            self._slots -= 1
+            self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self._slots += 1
+            self._cond.notify_all()
+
+    @property
+    def queued(self) -> int:
+        with self._cond:
+            return len(self._waiting)
+
+
+class OllamaBackend:
+    """
+    Minimal streaming client for Ollama's /api/generate over a pooled HTTP session.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        base_url: str = OLLAMA_BASE_URL,
+        temperature: float = 0,
+        keep_alive: str = OLLAMA_KEEP_ALIVE,
+        pool_size: int = max(LLM_MAX_CONCURRENCY, 4),
+    ):
+        self.model = model
+        self.url = f"{base_url.rstrip('/')}/api/generate"
+        self.options = {"temperature": temperature}
+        self.keep_alive = keep_alive
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def stream(self, prompt: str, stop: Optional[List[str]] = None, **kwargs: Any) -> Iterator[str]:
+        """
+        Stream generated text for a prompt.
+
+        Args:
+            prompt (str): Prompt to send.
+            stop (List[str], optional): Stop sequences.
+
+        Yields:
+            str: Generated text fragments.
+        """
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+            "options": {**self.options, **({"stop": stop} if stop else {})},
+        }
+        with self.session.post(self.url, json=payload, stream=True, timeout=(5, 300)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(data["error"])
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    break
+
+
+class LLMGateway:
+    """
+    Front door for every LLM call made by the service.
+
+    Provides a bounded, priority-ordered concurrency queue, single-flight
+    coalescing of identical in-flight prompts, and per-call deadlines.
+    """
+
+    def __init__(self, backend, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.backend = backend
+        self._slots = PrioritySemaphore(max_concurrency)
+        self._in_flight: Dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+
+    def stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        priority: int = PRIORITY_ANSWER,
+        timeout: Optional[float] = None,
+    ) -> Iterator[str]:
+        """
+        Stream a completion once a slot is free.
+
+        Args:
+            prompt (str): Prompt to send.
+            stop (List[str], optional): Stop sequences.
+            priority (int): Queue priority; lower is served first.
+            timeout (float, optional): Overall deadline in seconds, including queueing.
+
+        Yields:
+            str: Generated text fragments.
+
+        Raises:
+            TimeoutError: If the deadline passes while queued or generating.
+        """
+        timeout = timeout if timeout is not None else DEFAULT_TIMEOUTS.get(priority, 180)
+        deadline = time.monotonic() + timeout
+
+        queued_at = time.monotonic()
+        try:
+            self._slots.acquire(priority, timeout)
+        except TimeoutError:
+            LLM_TIMEOUTS.labels(str(priority)).inc()
+            raise
+        LLM_QUEUE_SECONDS.labels(str(priority)).observe(time.monotonic() - queued_at)
+
+        try:
+            for fragment in self.backend.stream(prompt, stop=stop):
+                if time.monotonic() > deadline:
+                    LLM_TIMEOUTS.labels(str(priority)).inc()
+                    raise TimeoutError("LLM call exceeded its deadline.")
+                yield fragment
+        finally:
+            self._slots.release()
+
+    def invoke(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        priority: int = PRIORITY_ANSWER,
+        timeout: Optional[float] = None,
+        on_token=None,
+    ) -> str:
+        """
+        Return a full completion, sharing it with identical concurrent calls.
+
+        Args:
+            prompt (str): Prompt to send.
+            stop (List[str], optional): Stop sequences.
+            priority (int): Queue priority; lower is served first.
+            timeout (float, optional): Overall deadline in seconds.
+            on_token (Callable[[str], None], optional): Receives tokens if this call leads.
+
+        Returns:
+            str: Generated text.
+        """
+        timeout = timeout if timeout is not None else DEFAULT_TIMEOUTS.get(priority, 180)
+        key = (prompt, tuple(stop or ()))
+
+        with self._lock:
+            leader_future = self._in_flight.get(key)
+            if leader_future is None:
+                future = Future()
+                self._in_flight[key] = future
+
+        if leader_future is not None:
+            LLM_COALESCED.inc()
+            try:
+                return leader_future.result(timeout=timeout)
+            except TimeoutError:
+                LLM_TIMEOUTS.labels(str(priority)).inc()
+                raise
+
+        try:
+            parts = []
+            for fragment in self.stream(prompt, stop=stop, priority=priority, timeout=timeout):
+                parts.append(fragment)
+                if on_token:
+                    on_token(fragment)
+            result = "".join(parts)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def stats(self) -> dict:
+        """
+        Report queue depth and in-flight coalescable calls.
+
+        Returns:
+            dict: Gateway usage figures.
+        """
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return {"queued": self._slots.queued, "coalescable_in_flight": in_flight}
+
+
+class GatewayLLM(LLM):
+    """
+    LangChain LLM that routes every call through an LLMGateway.
+
+    Accepts `priority` and `timeout` keyword arguments on invoke/stream.
+    """
+
+    gateway: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "gateway"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        return self.gateway.invoke(
+            prompt,
+            stop=stop,
+            priority=kwargs.get("priority", PRIORITY_ANSWER),
+            timeout=kwargs.get("timeout"),
+            on_token=run_manager.on_llm_new_token if run_manager else None,
+        )
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        for fragment in self.gateway.stream(
+            prompt,
+            stop=stop,
+            priority=kwargs.get("priority", PRIORITY_ANSWER),
+            timeout=kwargs.get("timeout"),
+        ):
+            if run_manager:
+                run_manager.on_llm_new_token(fragment)
+            yield GenerationChunk(text=fragment)
@@ -1,13 +1,24 @@
-from fastapi import FastAPI, UploadFile, File, Body, Query
+from fastapi import FastAPI, Request, Body, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
 import os
 import time
-from PyPDF2 import PdfReader
 
-from pdf_reader import extract_text_from_pdf
-from embeddings import chunk_text, get_embeddings, build_vectorstore
-from chatbot import chat_with_agent
-from shared_state import shared_state
+from embeddings import get_embeddings, embeddings_status
+from chatbot import chat_with_agent, chat_with_agent_stream
+import chatbot
+from shared_state import state_registry, DEFAULT_SESSION_ID
+from chat_history import HISTORY_RECENT_TURNS
+from ingestion import ingest_pdf
+from jobs import job_manager
+from router import router_stats
+from answer_cache import answer_cache
+import document_cache
+from metrics import render_metrics
+from uploads import store_upload, UploadTooLarge, InvalidUpload
 
 # Initialize FastAPI app
 app = FastAPI()
@@ -21,81 +32,221 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Define upload directory
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Questions are answered off the event loop; LLM concurrency itself is bounded by the gateway
+ASK_WORKERS = int(os.getenv("ASK_WORKERS", 16))
+ask_executor = ThreadPoolExecutor(max_workers=ASK_WORKERS, thread_name_prefix="ask")
 
 
-@app.post("/upload/")
-async def upload_pdf(file: UploadFile = File(...)):
+def answer_question(question: str, last_n: int, session_id: str) -> dict:
     """
-    Upload a PDF, extract its content, generate embeddings,
-    build a vector store, and reset any shared memory/state.
+    Answer a question for a session, blocking until the answer is complete.
+
+    Holds the session lock so concurrent questions on one session are
+    answered one at a time and never interleave their history updates.
 
     Args:
-        file (UploadFile): PDF file to be uploaded.
+        question (str): User's input question.
+        last_n (int): Number of past messages to include for context.
+        session_id (str): Session whose document and history are used.
+
+    Returns:
+        dict: Answer and processing time, or an error.
+    """
+    session = state_registry.get_session(session_id)
+    with session.lock:
+        doc_state = state_registry.session_document(session)
+        if doc_state is None:
+            return {
+                "error": "No PDF uploaded yet. Please upload one first.",
+                "response_time_seconds": 0
+            }
+
+        start_time = time.time()
+
+        # Generate answer using RAG + chat memory
+        answer = chat_with_agent(
+            question=question,
+            session=session,
+            doc_state=doc_state,
+            history=session.chat_history[-last_n:]
+        )
+
+        # Log the new turn for debugging (not the whole history, which grows per request)
+        session.print_last_turn()
+
+    return {
+        "question": question,
+        "answer": answer,
+        "response_time_seconds": round(time.time() - start_time, 2)
+    }
+
+
+@app.on_event("startup")
+def warm_embeddings():
+    """
+    Load the shared embedding model once at startup so uploads only pay
+    for extraction and encoding.
+    """
+    get_embeddings()
+
+
+@app.get("/ready/")
+def readiness():
+    """
+    Report whether the service is ready to ingest documents.
+
+    Returns:
+        dict: Readiness flag and embedding model load time.
+    """
+    status = embeddings_status()
+    return {"ready": status["ready"], "embeddings": status}
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Expose per-stage timing histograms and LLM call counters for Prometheus.
 
     Returns:
-        dict: Metadata about the upload, such as chunk count, page count, and processing time.
+        Response: Metrics in the Prometheus text exposition format.
     """
-    start_time = time.time()
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
 
-    # Validate file extension
-    if not file.filename.endswith(".pdf"):
-        return {"error": "Only PDF files are allowed."}
 
-    # Save uploaded file to disk
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+@app.get("/router/stats/")
+def get_router_stats():
+    """
+    Report how many intent and memory decisions the local router made without the LLM.
 
-    # Reset previous session state
-    shared_state.reset()
-    shared_state.uploaded_filename = file.filename
+    Returns:
+        dict: Local and LLM decision counters.
+    """
+    return router_stats()
 
-    # Step 1: Extract text from the PDF
-    text = extract_text_from_pdf(file_path)
-    if not text.strip():
-        return {"error": "No readable text found in the PDF."}
 
-    shared_state.global_text = text
+@app.get("/llm/stats/")
+def get_llm_stats():
+    """
+    Report LLM gateway queue depth and coalescable in-flight calls.
+
+    Returns:
+        dict: Gateway usage figures.
+    """
+    return chatbot.llm.gateway.stats()
+
 
-    # Step 2: Count number of pages in the PDF
+@app.get("/answers/cache/")
+def get_answer_cache_stats():
+    """
+    Report semantic answer cache hits, misses and size.
+
+    Returns:
+        dict: Answer cache counters.
+    """
+    return answer_cache.stats()
+
+
+@app.get("/registry/")
+def get_registry_stats():
+    """
+    Report active sessions and the memory used by resident documents.
+
+    Returns:
+        dict: Registry usage figures.
+    """
+    return state_registry.stats()
+
+
+@app.post("/upload/")
+async def upload_pdf(
+    request: Request,
+    session_id: str = Query(DEFAULT_SESSION_ID, description="Session that will chat about this PDF")
+):
+    """
+    Upload a PDF and queue it for background ingestion.
+
+    Send the PDF as multipart/form-data in a field named `file`. The body is
+    streamed straight to disk; oversized uploads are refused from their
+    Content-Length before the body is read.
+
+    Extraction, chunking, embedding and indexing run in a worker pool;
+    poll `/jobs/{job_id}` for progress. The new document replaces the
+    session's current one only once its index is built; other sessions
+    are unaffected.
+
+    Args:
+        request (Request): Multipart request carrying the PDF in its `file` field.
+        session_id (str): Session that will chat about this PDF.
+
+    Returns:
+        dict: Job id and initial status of the ingestion job.
+    """
+    # Stream the upload to disk under its content hash
     try:
-        reader = PdfReader(file_path)
-        shared_state.page_count = len(reader.pages)
-    except Exception as e:
-        shared_state.page_count = 0
-        print("[Page Count Error]", e)
-
-    # Step 3: Chunk the extracted text and generate embeddings
-    chunks = chunk_text(text)
-    embeddings_model = get_embeddings()
-    vectorstore = build_vectorstore(chunks, embeddings_model)
-
-    # Store in shared state
-    shared_state.vectorstore = vectorstore
-    shared_state.embeddings_model = embeddings_model
-    shared_state.chunks = chunks
+        file_path, doc_hash, _, filename = await store_upload(request)
+    except (UploadTooLarge, InvalidUpload) as e:
+        return {"error": str(e)}
+
+    job = job_manager.submit(filename, lambda job: ingest_pdf(
+        file_path, doc_hash, job, session_id, filename, summarize=chatbot.summarize_document_part
+    ))
 
     return {
-        "filename": file.filename,
-        "message": "PDF uploaded and processed successfully.",
-        "num_chunks": len(chunks),
-        "page_count": shared_state.page_count,
-        "processing_time_seconds": round(time.time() - start_time, 2)
+        "filename": filename,
+        "doc_id": doc_hash,
+        "job_id": job.id,
+        "status": job.status,
+        "message": "PDF accepted for processing.",
     }
 
 
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """
+    Report the progress of an ingestion job.
+
+    Args:
+        job_id (str): Id returned by `/upload/`.
+
+    Returns:
+        dict: Status, stage, pages done, elapsed time and, when finished, the result.
+    """
+    snapshot = job_manager.snapshot(job_id)
+    if snapshot is None:
+        return {"error": "Unknown job id."}
+    return snapshot
+
+
+@app.delete("/cache/")
+def clear_cache(doc_hash: str = Query(None, description="Content hash of a single entry to drop")):
+    """
+    Invalidate cached extraction results and indexes.
+
+    Resident copies and cached answers are dropped too, so later uploads
+    rebuild the document instead of reusing the in-memory one.
+
+    Args:
+        doc_hash (str, optional): Drop only this entry; drop everything if omitted.
+
+    Returns:
+        dict: Confirmation message.
+    """
+    document_cache.invalidate(doc_hash)
+    state_registry.remove_document(doc_hash)
+    return {"message": "Cache entry removed." if doc_hash else "Cache cleared."}
+
+
 @app.post("/ask/")
 async def ask_question(
     question: str = Body(..., embed=True),
     last_n: int = Query(
-        30,
+        HISTORY_RECENT_TURNS,
         ge=1,
-        le=100,
-        description="How many past turns to include in memory"
-    )
+        le=HISTORY_RECENT_TURNS,
+        description="How many recent turns to include verbatim; older ones are only in the summary"
+    ),
+    session_id: str = Query(DEFAULT_SESSION_ID, description="Session to answer in")
 ):
     """
     Respond to a user question using Retrieval-Augmented Generation (RAG) and chat history.
@@ -103,31 +254,74 @@ async def ask_question(
     Args:
         question (str): User's input question.
         last_n (int): Number of past messages to include for context.
+        session_id (str): Session whose document and history are used.
 
     Returns:
         dict: Answer to the user's question, including processing time.
     """
-    if not shared_state.vectorstore:
-        return {
-            "error": "No PDF uploaded yet. Please upload one first.",
-            "response_time_seconds": 0
-        }
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(ask_executor, answer_question, question, last_n, session_id)
 
-    start_time = time.time()
 
-    # Generate answer using RAG + chat memory
-    answer = chat_with_agent(
-        question=question,
-        vectorstore=shared_state.vectorstore,
-        embeddings_model=shared_state.embeddings_model,
-        history=shared_state.chat_history[-last_n:]
-    )
+@app.post("/ask/stream/")
+def ask_question_stream(
+    question: str = Body(..., embed=True),
+    last_n: int = Query(
+        HISTORY_RECENT_TURNS,
+        ge=1,
+        le=HISTORY_RECENT_TURNS,
+        description="How many recent turns to include verbatim; older ones are only in the summary"
+    ),
+    session_id: str = Query(DEFAULT_SESSION_ID, description="Session to answer in")
+):
+    """
+    Stream the answer to a question as Server-Sent Events.
 
-    # Print chat history for debugging/logging
-    shared_state.print_chat_history()
+    Each generated token is sent as a `token` event; a final `done` event
+    carries the full answer, time-to-first-token and total time.
 
-    return {
-        "question": question,
-        "answer": answer,
-        "response_time_seconds": round(time.time() - start_time, 2)
-    }
+    Args:
+        question (str): User's input question.
+        last_n (int): Number of past messages to include for context.
+        session_id (str): Session whose document and history are used.
+
+    Returns:
+        StreamingResponse: `text/event-stream` of answer tokens.
+    """
+    def sse(event: str, data: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def event_stream():
+        session = state_registry.get_session(session_id)
+        with session.lock:
+            yield from session_events(session)
+
+    def session_events(session):
+        doc_state = state_registry.session_document(session)
+        if doc_state is None:
+            yield sse("error", {"error": "No PDF uploaded yet. Please upload one first."})
+            return
+
+        start_time = time.time()
+        first_token_time = None
+        parts = []
+
+        for token in chat_with_agent_stream(
+            question=question,
+            session=session,
+            doc_state=doc_state,
+            history=session.chat_history[-last_n:]
+        ):
+            if first_token_time is None:
+                first_token_time = time.time()
+            parts.append(token)
+            yield sse("token", {"token": token})
+
+        yield sse("done", {
+            "question": question,
+            "answer": "".join(parts).strip(),
+            "time_to_first_token_seconds": round((first_token_time or time.time()) - start_time, 2),
+            "response_time_seconds": round(time.time() - start_time, 2)
+        })
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
@@ -0,0 +1,145 @@
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from langchain.callbacks.base import BaseCallbackHandler
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# Buckets span sub-millisecond lookups up to multi-minute OCR/LLM work
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+STAGE_SECONDS = Histogram(
+    "pdf_chatbot_stage_seconds",
+    "Time spent in each pipeline stage.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    "pdf_chatbot_stage_errors_total",
+    "Pipeline stages that raised an exception.",
+    ["stage"],
+)
+LLM_CALLS = Counter(
+    "pdf_chatbot_llm_calls_total",
+    "LLM calls by purpose.",
+    ["purpose"],
+)
+LLM_PROMPT_CHARS = Histogram(
+    "pdf_chatbot_llm_prompt_chars",
+    "Prompt size sent to the LLM, in characters.",
+    ["purpose"],
+    buckets=SIZE_BUCKETS,
+)
+LLM_COMPLETION_CHARS = Histogram(
+    "pdf_chatbot_llm_completion_chars",
+    "Completion size returned by the LLM, in characters.",
+    ["purpose"],
+    buckets=SIZE_BUCKETS,
+)
+LLM_QUEUE_SECONDS = Histogram(
+    "pdf_chatbot_llm_queue_seconds",
+    "Time LLM calls waited for a gateway slot.",
+    ["priority"],
+    buckets=STAGE_BUCKETS,
+)
+LLM_COALESCED = Counter(
+    "pdf_chatbot_llm_coalesced_total",
+    "LLM calls answered by an identical call already in flight.",
+)
+LLM_TIMEOUTS = Counter(
+    "pdf_chatbot_llm_timeouts_total",
+    "LLM calls that exceeded their deadline.",
+    ["priority"],
+)
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "pdf_chatbot_embedding_cache_lookups_total",
+    "Chunk embedding cache lookups by result.",
+    ["result"],
+)
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Time a block of work and record it under `stage`.
+
+    Args:
+        stage (str): Stage label, e.g. "extract_pymupdf" or "agent_run".
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start_time)
+
+
+def timed(stage: str):
+    """
+    Decorator form of `span` for plain (non-generator) functions.
+
+    Args:
+        stage (str): Stage label.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_stage(stage: str, seconds: float):
+    """
+    Record a duration measured elsewhere, e.g. inside a worker process.
+
+    Args:
+        stage (str): Stage label.
+        seconds (float): Measured duration.
+    """
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def observe_llm_call(purpose: str, prompt: str, completion: str):
+    """
+    Record one LLM call and its prompt and completion sizes.
+
+    Args:
+        purpose (str): What the call was for, e.g. "detect_intent".
+        prompt (str): Prompt text sent.
+        completion (str): Text generated.
+    """
+    LLM_CALLS.labels(purpose).inc()
+    LLM_PROMPT_CHARS.labels(purpose).observe(len(prompt))
+    LLM_COMPLETION_CHARS.labels(purpose).observe(len(completion))
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """
+    Record sizes of LLM calls made inside LangChain chains and agents.
+    """
+
+    def __init__(self, purpose: str):
+        self.purpose = purpose
+        self._prompts = []
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._prompts = prompts
+
+    def on_llm_end(self, response, **kwargs):
+        for prompt, generations in zip(self._prompts, response.generations):
+            observe_llm_call(self.purpose, prompt, "".join(g.text for g in generations))
+
+
+def render_metrics():
+    """
+    Render all metrics in the Prometheus text exposition format.
+
+    Returns:
+        Tuple[bytes, str]: Payload and its content type.
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,112 +1,325 @@
 import fitz  # PyMuPDF
 import pytesseract
 from PIL import Image
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+from concurrent.futures import Future, ProcessPoolExecutor
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import multiprocessing
 import os
+import time
 
-from shared_state import shared_state
+from document import ParsedDocument
+from metrics import observe_stage
 
 
-def extract_text_with_pymupdf(file_path: str) -> str:
+# === Configuration ===
+OCR_MIN_PAGE_CHARS = 30  # Pages with fewer alphanumeric characters are OCR'd
+OCR_DPI = int(os.getenv("OCR_DPI", 200))  # Rasterisation resolution for OCR
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", max(1, (os.cpu_count() or 1) - 1)))
+OCR_PAGES_IN_FLIGHT = int(os.getenv("OCR_PAGES_IN_FLIGHT", OCR_WORKERS * 2))  # Bounds page images held in RAM
+
+# The server process runs many threads (uvicorn, torch, worker pools); forking it can
+# copy locks held by other threads and deadlock the child, so OCR workers start clean
+OCR_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _ocr_pool(workers: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(OCR_START_METHOD))
+
+
+def needs_ocr(page_text: str) -> bool:
     """
-    Attempt to extract text from a digitally generated PDF using PyMuPDF.
+    Decide whether a page's embedded text is too sparse to be trusted.
 
     Args:
-        file_path (str): Path to the PDF file.
+        page_text (str): Text extracted by PyMuPDF for one page.
 
     Returns:
-        str: Extracted text or an empty string if none found.
+        bool: True if the page should be rasterised and OCR'd.
     """
-    try:
-        doc = fitz.open(file_path)
-        extracted_pages = []
+    return sum(ch.isalnum() for ch in page_text) < OCR_MIN_PAGE_CHARS
 
-        shared_state.page_count = len(doc)
-        print(f"[INFO] PyMuPDF detected {shared_state.page_count} pages.")
 
-        for i, page in enumerate(doc):
-            page_text = page.get_text().strip()
-            if page_text:
-                extracted_pages.append(page_text)
-            else:
-                print(f"[WARN] Page {i + 1} is empty using PyMuPDF.")
+def ocr_page(file_path: str, page_number: int, dpi: int = OCR_DPI) -> str:
+    """
+    Rasterise a single page and extract its text with Tesseract.
 
-        if extracted_pages:
-            print(f"[INFO] PyMuPDF extracted text from {len(extracted_pages)} pages.")
-        else:
-            print("[WARN] PyMuPDF found no usable text.")
+    Only this page's image is ever held in memory, so it is safe to run
+    in a worker process.
 
-        return "\n\n".join(extracted_pages)
+    Args:
+        file_path (str): Path to the PDF file.
+        page_number (int): 1-based page number.
+        dpi (int): Rasterisation resolution.
 
+    Returns:
+        str: OCR text for the page or an empty string if none was found.
+    """
+    try:
+        images = convert_from_path(file_path, dpi=dpi, first_page=page_number, last_page=page_number)
+        if not images:
+            return ""
+        return pytesseract.image_to_string(images[0], lang="eng").strip()
     except Exception as e:
-        print(f"[ERROR] PyMuPDF failed to read PDF: {e}")
+        print(f"[ERROR] OCR failed on page {page_number}: {e}")
         return ""
 
 
-def extract_text_with_ocr(file_path: str) -> str:
+def _timed_ocr_page(file_path: str, page_number: int, dpi: int) -> Tuple[str, float]:
+    # Worker processes cannot update the parent's metrics, so return the duration
+    start_time = time.perf_counter()
+    text = ocr_page(file_path, page_number, dpi)
+    return text, time.perf_counter() - start_time
+
+
+def iter_ocr_pages(
+    file_path: str,
+    page_numbers: List[int],
+    dpi: int = OCR_DPI,
+    workers: int = OCR_WORKERS,
+) -> Iterator[Tuple[int, str]]:
     """
-    Fallback method: Convert each page to an image and extract text using OCR.
+    OCR pages in a bounded process pool and yield results in page order.
+
+    At most `OCR_PAGES_IN_FLIGHT` pages are rendered or recognised at once,
+    so peak memory stays flat regardless of document length.
 
     Args:
         file_path (str): Path to the PDF file.
+        page_numbers (List[int]): 1-based pages to OCR, in the order to yield them.
+        dpi (int): Rasterisation resolution.
+        workers (int): Number of worker processes.
+
+    Yields:
+        Tuple[int, str]: Page number and its OCR text.
+    """
+    if workers <= 1 or len(page_numbers) <= 1:
+        for page_number in page_numbers:
+            text, seconds = _timed_ocr_page(file_path, page_number, dpi)
+            observe_stage("ocr_page", seconds)
+            yield page_number, text
+        return
+
+    max_in_flight = max(workers, OCR_PAGES_IN_FLIGHT)
+    pending = iter(page_numbers)
+    in_flight = deque()
+
+    with _ocr_pool(min(workers, len(page_numbers))) as pool:
+        for page_number in pending:
+            in_flight.append((page_number, pool.submit(_timed_ocr_page, file_path, page_number, dpi)))
+            if len(in_flight) >= max_in_flight:
+                break
+
+        while in_flight:
+            page_number, future = in_flight.popleft()
+            text, seconds = future.result()
+            observe_stage("ocr_page", seconds)
+
+            # Refill the window before handing the result back
+            next_page = next(pending, None)
+            if next_page is not None:
+                in_flight.append((next_page, pool.submit(_timed_ocr_page, file_path, next_page, dpi)))
+
+            yield page_number, text
+
+
+def extract_text_with_ocr(
+    file_path: str,
+    page_numbers: Optional[List[int]] = None,
+    progress: Optional[Callable] = None,
+) -> Dict[int, str]:
+    """
+    Convert selected pages to images and extract their text using OCR.
+
+    Args:
+        file_path (str): Path to the PDF file.
+        page_numbers (List[int], optional): 1-based pages to OCR; all pages if omitted.
+        progress (Callable, optional): Called as progress(stage, done, total) after each page.
 
     Returns:
-        str: Text extracted using OCR or an empty string if unsuccessful.
+        Dict[int, str]: OCR text keyed by 1-based page number.
     """
+    results = {}
     try:
-        images = convert_from_path(file_path)
-        text_blocks = []
+        if page_numbers is None:
+            page_numbers = list(range(1, pdfinfo_from_path(file_path)["Pages"] + 1))
 
-        shared_state.page_count = len(images)
-        print(f"[INFO] OCR fallback: {shared_state.page_count} image pages found.")
+        print(f"[INFO] OCR: processing {len(page_numbers)} page(s) with {OCR_WORKERS} worker(s) at {OCR_DPI} DPI.")
 
-        for i, img in enumerate(images):
-            text = pytesseract.image_to_string(img, lang="eng").strip()
-            if text:
-                text_blocks.append(text)
-            else:
-                print(f"[WARN] OCR found no text on page {i + 1}.")
+        for page_number, text in iter_ocr_pages(file_path, page_numbers):
+            if not text:
+                print(f"[WARN] OCR found no text on page {page_number}.")
+            results[page_number] = text
+            if progress:
+                progress("ocr", len(results), len(page_numbers))
 
-        if text_blocks:
-            print(f"[INFO] OCR extracted text from {len(text_blocks)} pages.")
+        found = sum(1 for text in results.values() if text)
+        if found:
+            print(f"[INFO] OCR extracted text from {found} pages.")
         else:
             print("[WARN] OCR found no usable text.")
 
-        return "\n\n".join(text_blocks)
-
     except Exception as e:
         print(f"[ERROR] OCR extraction failed: {e}")
-        return ""
 
+    return results
 
-def extract_text_from_pdf(file_path: str) -> str:
+
+def _run_inline(fn: Callable, *args) -> Future:
+    # Completed future, so inline and pooled OCR share one code path
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def iter_pages(file_path: str, progress: Optional[Callable] = None) -> Iterator[Tuple[int, str]]:
     """
-    Main function for text extraction from any type of PDF.
+    Yield per-page text in page order as soon as each page is final.
+
+    Pages are read from PyMuPDF one at a time. A page without usable embedded
+    text is sent to the OCR pool as soon as it is read, and pages are yielded
+    in order as they become final, so digital pages flow downstream at once
+    and consumers can chunk and embed them while later pages are still being
+    read or recognised. At most max(OCR_WORKERS, OCR_PAGES_IN_FLIGHT) pages
+    are held at a time.
+
+    Args:
+        file_path (str): Path to the PDF file.
+        progress (Callable, optional): Called as progress(stage, done, total) as pages complete.
+
+    Yields:
+        Tuple[int, str]: 1-based page number and its text.
+    """
+    try:
+        doc = fitz.open(file_path)
+    except Exception as e:
+        print(f"[ERROR] PyMuPDF failed to read PDF: {e}")
+        doc = None
+
+    if doc is None or len(doc) == 0:
+        # PyMuPDF could not open the file; let OCR try every page
+        if doc is not None:
+            doc.close()
+        ocr_results = extract_text_with_ocr(file_path, progress=progress)
+        for page_number in sorted(ocr_results):
+            yield page_number, ocr_results[page_number]
+        return
+
+    total = len(doc)
+    print(f"[INFO] PyMuPDF detected {total} pages.")
+    read_seconds = 0.0  # PyMuPDF time only; time spent in consumers between yields is excluded
+    max_in_flight = max(OCR_WORKERS, OCR_PAGES_IN_FLIGHT)
+    window = deque()  # (page number, embedded text, OCR future or None), in page order
+    pool = None
+    ocr_submitted = ocr_done = 0
+
+    def finish(entry) -> Tuple[int, str]:
+        nonlocal ocr_done
+        page_number, text, future = entry
+        if future is None:
+            return page_number, text
+        try:
+            ocr_text, seconds = future.result()
+            observe_stage("ocr_page", seconds)
+            # Keep the PyMuPDF text if OCR did no better
+            if len(ocr_text) > len(text):
+                text = ocr_text
+        except Exception as e:
+            print(f"[ERROR] OCR failed on page {page_number}: {e}")
+        ocr_done += 1
+        if progress:
+            progress("ocr", ocr_done, ocr_submitted)
+        return page_number, text
+
+    try:
+        for index, page in enumerate(doc):
+            page_number = index + 1
+            start_time = time.perf_counter()
+            text = page.get_text().strip()
+            read_seconds += time.perf_counter() - start_time
+            if progress:
+                progress("extract", page_number, total)
+
+            future = None
+            if needs_ocr(text):
+                if OCR_WORKERS > 1:
+                    if pool is None:
+                        pool = _ocr_pool(OCR_WORKERS)
+                    future = pool.submit(_timed_ocr_page, file_path, page_number, OCR_DPI)
+                else:
+                    future = _run_inline(_timed_ocr_page, file_path, page_number, OCR_DPI)
+                ocr_submitted += 1
+            window.append((page_number, text, future))
+
+            # Release finished pages in order; wait on the oldest only once the window is full
+            while window and (window[0][2] is None or window[0][2].done() or len(window) >= max_in_flight):
+                yield finish(window.popleft())
+
+        while window:
+            yield finish(window.popleft())
+
+        if ocr_submitted:
+            print(f"[INFO] {ocr_submitted} of {total} page(s) needed OCR at {OCR_DPI} DPI.")
+    finally:
+        doc.close()
+        observe_stage("extract_pymupdf", read_seconds)
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_pages_from_pdf(file_path: str, progress: Optional[Callable] = None) -> List[str]:
+    """
+    Extract per-page text, OCR-ing only pages without usable embedded text.
 
     Steps:
-    1. Attempt text extraction using PyMuPDF.
-    2. If PyMuPDF fails or finds insufficient text, fall back to OCR.
+    1. Extract every page using PyMuPDF.
+    2. Rasterise and OCR only the pages that are empty or below the density threshold.
 
     Args:
         file_path (str): Path to the PDF file.
+        progress (Callable, optional): Called as progress(stage, done, total) as pages complete.
 
     Returns:
-        str: Complete extracted text.
+        List[str]: Text for each page, in page order.
     """
-    print(f"[INFO] Starting PDF extraction: {file_path}")
+    return [text for _, text in iter_pages(file_path, progress)]
+
 
-    # Record the uploaded file name in shared state
-    shared_state.uploaded_filename = os.path.basename(file_path)
+def parse_pdf(file_path: str, progress: Optional[Callable] = None, filename: Optional[str] = None) -> ParsedDocument:
+    """
+    Parse a PDF once into a per-page document model.
 
-    # Step 1: Try extracting using PyMuPDF
-    text = extract_text_with_pymupdf(file_path)
+    Digital pages keep their PyMuPDF text; only scanned or sparse pages are OCR'd.
 
-    # Step 2: Fallback to OCR if needed
-    if not text or len(text.strip()) < 30:
-        print("[INFO] Falling back to OCR-based extraction...")
-        text = extract_text_with_ocr(file_path)
+    Args:
+        file_path (str): Path to the PDF file.
+        progress (Callable, optional): Called as progress(stage, done, total) as pages complete.
+        filename (str, optional): Name to record for the document; defaults to the file's name.
 
-    shared_state.global_text = text or ""
+    Returns:
+        ParsedDocument: Page count, per-page text and page offsets.
+    """
+    print(f"[INFO] Starting PDF extraction: {file_path}")
+
+    filename = filename or os.path.basename(file_path)
+    document = ParsedDocument(filename, extract_pages_from_pdf(file_path, progress))
     print("[INFO] Text extraction complete.")
 
-    return text or ""
+    return document
+
+
+def extract_text_from_pdf(file_path: str) -> str:
+    """
+    Main function for text extraction from any type of PDF.
+
+    Args:
+        file_path (str): Path to the PDF file.
+
+    Returns:
+        str: Complete extracted text.
+    """
+    return parse_pdf(file_path).text
@@ -0,0 +1,215 @@
+import os
+from typing import Dict, List
+
+import numpy as np
+
+from embeddings import embed_query, embed_texts, get_embeddings
+from chat_history import estimate_tokens, CHARS_PER_TOKEN
+from metrics import timed
+
+# === Configuration ===
+HYBRID_CANDIDATES = 20  # Results taken from each retriever before fusion
+RRF_K = 60              # Reciprocal-rank-fusion damping constant
+
+CONTEXT_CANDIDATES = 12  # Fused chunks considered when packing a context
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 700))  # Default size of a packed context
+MMR_LAMBDA = 0.7         # 1.0 = pure relevance, 0.0 = pure diversity
+MERGE_GAP_BYTES = 8      # Chunks this close (or overlapping) are merged into one passage
+
+
+def vector_search(query: str, doc_state, k: int) -> List[int]:
+    """
+    Return chunk indexes nearest to the query in the FAISS index.
+
+    Row ids are mapped to chunks through the chunk store, so no docstore lookup is needed.
+
+    Args:
+        query (str): Free-text query.
+        doc_state (DocumentState): Document to search.
+        k (int): Maximum number of results.
+
+    Returns:
+        List[int]: Chunk indexes, best first.
+    """
+    index = doc_state.index
+    k = min(k, index.ntotal)
+    if k <= 0:
+        return []
+    query_vector = np.asarray([embed_query(query)], dtype="float32")
+    _, ids = index.search(query_vector, k)
+    return doc_state.chunks.chunks_for_rows(int(i) for i in ids[0] if i >= 0)
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int) -> List[int]:
+    """
+    Merge ranked lists by summing 1 / (RRF_K + rank) per item.
+
+    Args:
+        rankings (List[List[int]]): Ranked chunk indexes from each retriever.
+        k (int): Number of fused results to return.
+
+    Returns:
+        List[int]: Fused chunk indexes, best first.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+
+def hybrid_ids(query: str, doc_state, k: int) -> List[int]:
+    """
+    Return chunk indexes from BM25 and FAISS together, fused by reciprocal rank.
+
+    Lexical matching catches exact identifiers and clause numbers that
+    embeddings miss; vector search catches paraphrases.
+
+    Args:
+        query (str): Free-text query.
+        doc_state (DocumentState): Document to search.
+        k (int): Number of chunk indexes to return.
+
+    Returns:
+        List[int]: Chunk indexes, best first.
+    """
+    candidates = max(k, HYBRID_CANDIDATES)
+    vector_ids = vector_search(query, doc_state, candidates)
+    lexical_ids = [chunk_id for chunk_id, _ in doc_state.bm25.search(query, candidates)]
+    return reciprocal_rank_fusion([vector_ids, lexical_ids], k)
+
+
+def _chunk_vectors(doc_state, chunk_ids: List[int]) -> np.ndarray:
+    """
+    Fetch stored vectors for chunks, falling back to the embedding cache.
+
+    Args:
+        doc_state (DocumentState): Document the chunks belong to.
+        chunk_ids (List[int]): Chunk indexes.
+
+    Returns:
+        np.ndarray: L2-normalised float32 vectors, one row per chunk.
+    """
+    index = doc_state.index
+    try:
+        vectors = np.stack([index.reconstruct(int(doc_state.chunks.rows[i])) for i in chunk_ids])
+    except RuntimeError:
+        # IVF indexes without a direct map cannot reconstruct rows
+        vectors = embed_texts([doc_state.chunks.text(i) for i in chunk_ids], get_embeddings())
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype("float32")
+
+
+def mmr_order(query_vector: np.ndarray, vectors: np.ndarray, mmr_lambda: float = MMR_LAMBDA) -> List[int]:
+    """
+    Order candidates by maximal marginal relevance.
+
+    Each step picks the candidate most similar to the query and least similar
+    to those already picked, so near-duplicate chunks sink to the end.
+
+    Args:
+        query_vector (np.ndarray): L2-normalised query embedding.
+        vectors (np.ndarray): L2-normalised candidate embeddings.
+        mmr_lambda (float): Trade-off between relevance and diversity.
+
+    Returns:
+        List[int]: Positions into `vectors`, in pick order.
+    """
+    relevance = vectors @ query_vector
+    similarity = vectors @ vectors.T
+    remaining = list(range(len(vectors)))
+    order: List[int] = []
+    while remaining:
+        if order:
+            redundancy = similarity[np.ix_(remaining, order)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+        best = remaining[int(np.argmax(scores))]
+        order.append(best)
+        remaining.remove(best)
+    return order
+
+
+def merge_passages(doc_state, chunk_ids: List[int]) -> List[dict]:
+    """
+    Merge overlapping or adjacent chunks into passages, in document order.
+
+    Args:
+        doc_state (DocumentState): Document the chunks belong to.
+        chunk_ids (List[int]): Chunk indexes to merge.
+
+    Returns:
+        List[dict]: Passages with 'start' and 'end' byte offsets and their 'pages'.
+    """
+    store = doc_state.chunks
+    passages: List[dict] = []
+    for chunk_id in sorted(chunk_ids, key=lambda i: int(store.starts[i])):
+        start, end = int(store.starts[chunk_id]), int(store.ends[chunk_id])
+        page = store.page(chunk_id)
+        if passages and start <= passages[-1]["end"] + MERGE_GAP_BYTES:
+            last = passages[-1]
+            last["end"] = max(last["end"], end)
+            if page not in last["pages"]:
+                last["pages"].append(page)
+        else:
+            passages.append({"start": start, "end": end, "pages": [page]})
+    return passages
+
+
+def format_passages(doc_state, passages: List[dict]) -> str:
+    """
+    Render passages as page-labelled text blocks.
+
+    Args:
+        doc_state (DocumentState): Document the passages belong to.
+        passages (List[dict]): Output of `merge_passages`.
+
+    Returns:
+        str: Passages separated by blank lines.
+    """
+    blocks = []
+    for passage in passages:
+        pages = passage["pages"]
+        label = f"Page {pages[0]}" if len(pages) == 1 else f"Pages {pages[0]}-{pages[-1]}"
+        blocks.append(f"[{label}]\n{doc_state.chunks.span_text(passage['start'], passage['end']).strip()}")
+    return "\n\n".join(blocks)
+
+
+@timed("build_context")
+def build_context(query: str, doc_state, token_budget: int = CONTEXT_TOKEN_BUDGET, candidates: int = CONTEXT_CANDIDATES) -> str:
+    """
+    Build a compact, diverse context for a question within a token budget.
+
+    Takes a wide hybrid candidate set, orders it by maximal marginal relevance,
+    and adds chunks in that order while the merged passages still fit the
+    budget. Overlapping or adjacent chunks are merged, so overlap text is sent once.
+
+    Args:
+        query (str): Free-text query.
+        doc_state (DocumentState): Document to search.
+        token_budget (int): Maximum estimated tokens of the returned context.
+        candidates (int): Fused chunks to consider.
+
+    Returns:
+        str: Page-labelled passages in document order, or "" if nothing matched.
+    """
+    candidate_ids = hybrid_ids(query, doc_state, candidates)
+    if not candidate_ids:
+        return ""
+
+    query_vector = np.asarray(embed_query(query), dtype="float32")
+    query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+    order = mmr_order(query_vector, _chunk_vectors(doc_state, candidate_ids))
+
+    selected: List[int] = []
+    context = ""
+    for position in order:
+        trial = selected + [candidate_ids[position]]
+        text = format_passages(doc_state, merge_passages(doc_state, trial))
+        if estimate_tokens(text) <= token_budget:
+            selected, context = trial, text
+        elif not selected:
+            # Even the most relevant chunk alone is over budget; send it trimmed
+            return text[: token_budget * CHARS_PER_TOKEN]
+    return context
@@ -0,0 +1,212 @@
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from embeddings import get_embeddings, embed_query
+
+# === Configuration ===
+ROUTER_MIN_SIMILARITY = 0.45  # Best prototype must be at least this similar
+ROUTER_MIN_MARGIN = 0.05      # ...and this much ahead of the runner-up label
+
+# === Labelled prototypes ===
+INTENT_PROTOTYPES: Dict[str, List[str]] = {
+    "page stats": [
+        "How many pages does the document have?",
+        "What is the word count of this PDF?",
+        "How many sentences are in the file?",
+        "How many paragraphs does it contain?",
+        "How long is this document?",
+    ],
+    "page info": [
+        "What is on page 3?",
+        "Show me the content of page 10.",
+        "What does the first page say?",
+        "Read the last page for me.",
+    ],
+    "summarization": [
+        "Summarize this document.",
+        "Give me a short overview of the PDF.",
+        "What is this document about?",
+        "Provide the key points in brief.",
+        "TL;DR of the file.",
+    ],
+    "document content": [
+        "What does the document say about the payment terms?",
+        "Who is the author of the report?",
+        "What is the conclusion of the study?",
+        "Explain the method described in section 2.",
+        "What are the requirements listed for installation?",
+    ],
+}
+
+MEMORY_PROTOTYPES: Dict[str, List[str]] = {
+    "yes": [
+        "What did I ask you before?",
+        "Can you repeat your last answer?",
+        "What was my previous question?",
+        "Explain that in more detail.",
+        "Why did you say that?",
+        "What did we talk about earlier?",
+    ],
+    "no": [
+        "What is the main topic of the document?",
+        "How many pages are there?",
+        "Summarize the PDF.",
+        "What does section 4 describe?",
+        "Who signed the agreement?",
+    ],
+}
+
+# === Cheap lexical rules (checked before embeddings) ===
+INTENT_RULES: List[Tuple[str, re.Pattern]] = [
+    ("page stats", re.compile(r"\bhow many (pages|words|sentences|paragraphs)\b|\b(page|word|sentence|paragraph) count\b|\bnumber of (pages|words|sentences|paragraphs)\b")),
+    ("page info", re.compile(r"\bpage\s*\d+\b")),
+    ("summarization", re.compile(r"\bsummar(y|ise|ize|ization|isation)\b|\btl;?dr\b|\boverview\b")),
+]
+
+# Only phrases that unambiguously refer back to the conversation; bare words such as
+# "before", "above" or "previous" also occur in document questions and are left to
+# the prototypes or the LLM
+MEMORY_RULES = re.compile(
+    r"\b(you (just )?(said|mentioned|told me|answered|wrote)|i (just )?(asked|said|mentioned)|"
+    r"(did|have) you (say|said|mention|tell me)|did i (ask|say|mention)|"
+    r"we (discussed|talked about)|(my|the) (last|previous|earlier) (question|message)|"
+    r"your (last|previous|earlier) (answer|reply|response|message)|"
+    r"repeat (that|yourself|your (last )?(answer|reply|response)))\b"
+)
+
+# === Decision counters ===
+_stats = {"intent_local": 0, "intent_llm": 0, "memory_local": 0, "memory_llm": 0}
+_stats_lock = threading.Lock()
+
+_prototype_vectors: Dict[str, Tuple[List[str], np.ndarray]] = {}
+_prototype_lock = threading.Lock()
+
+
+def _normalise(vectors) -> np.ndarray:
+    array = np.asarray(vectors, dtype="float32")
+    norms = np.linalg.norm(array, axis=-1, keepdims=True)
+    return array / np.maximum(norms, 1e-12)
+
+
+def _prototypes(name: str, prototypes: Dict[str, List[str]]) -> Tuple[List[str], np.ndarray]:
+    """
+    Embed a prototype set once and cache its label list and unit vectors.
+    """
+    if name not in _prototype_vectors:
+        with _prototype_lock:
+            if name not in _prototype_vectors:
+                labels, texts = [], []
+                for label, examples in prototypes.items():
+                    labels.extend([label] * len(examples))
+                    texts.extend(examples)
+                vectors = _normalise(get_embeddings().embed_documents(texts))
+                _prototype_vectors[name] = (labels, vectors)
+    return _prototype_vectors[name]
+
+
+def _nearest_label(question: str, name: str, prototypes: Dict[str, List[str]]) -> Tuple[str, float, float]:
+    """
+    Score a question against labelled prototypes.
+
+    Returns:
+        Tuple[str, float, float]: Best label, its similarity and the margin over the runner-up label.
+    """
+    labels, vectors = _prototypes(name, prototypes)
+    query = _normalise(embed_query(question))
+    scores = vectors @ query
+
+    best: Dict[str, float] = {}
+    for label, score in zip(labels, scores):
+        best[label] = max(best.get(label, -1.0), float(score))
+
+    ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+    top_label, top_score = ranked[0]
+    margin = top_score - ranked[1][1] if len(ranked) > 1 else top_score
+    return top_label, top_score, margin
+
+
+def _record(key: str):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def route_intent(question: str) -> Optional[str]:
+    """
+    Classify a question's intent locally, without calling the LLM.
+
+    Args:
+        question (str): The user's input question.
+
+    Returns:
+        str | None: An intent label, or None when confidence is too low and the LLM should decide.
+    """
+    text = question.lower()
+    for label, pattern in INTENT_RULES:
+        if pattern.search(text):
+            print(f"[ROUTER] intent={label} source=rule confidence=1.00")
+            _record("intent_local")
+            return label
+
+    try:
+        label, score, margin = _nearest_label(question, "intent", INTENT_PROTOTYPES)
+    except Exception as e:
+        print("[ROUTER] Embedding classification failed:", e)
+        _record("intent_llm")
+        return None
+
+    if score >= ROUTER_MIN_SIMILARITY and margin >= ROUTER_MIN_MARGIN:
+        print(f"[ROUTER] intent={label} source=embedding confidence={score:.2f} margin={margin:.2f}")
+        _record("intent_local")
+        return label
+
+    print(f"[ROUTER] intent=? source=llm confidence={score:.2f} margin={margin:.2f}")
+    _record("intent_llm")
+    return None
+
+
+def route_memory(question: str) -> Optional[bool]:
+    """
+    Decide locally whether a question depends on earlier conversation turns.
+
+    Args:
+        question (str): The user's current question.
+
+    Returns:
+        bool | None: The decision, or None when confidence is too low and the LLM should decide.
+    """
+    if MEMORY_RULES.search(question.lower()):
+        print("[ROUTER] memory=yes source=rule confidence=1.00")
+        _record("memory_local")
+        return True
+
+    try:
+        label, score, margin = _nearest_label(question, "memory", MEMORY_PROTOTYPES)
+    except Exception as e:
+        print("[ROUTER] Embedding classification failed:", e)
+        _record("memory_llm")
+        return None
+
+    if score >= ROUTER_MIN_SIMILARITY and margin >= ROUTER_MIN_MARGIN:
+        print(f"[ROUTER] memory={label} source=embedding confidence={score:.2f} margin={margin:.2f}")
+        _record("memory_local")
+        return label == "yes"
+
+    print(f"[ROUTER] memory=? source=llm confidence={score:.2f} margin={margin:.2f}")
+    _record("memory_llm")
+    return None
+
+
+def router_stats() -> dict:
+    """
+    Return how many routing decisions were made locally versus by the LLM.
+
+    Returns:
+        dict: Decision counters and the number of LLM calls saved.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["llm_calls_saved"] = stats["intent_local"] + stats["memory_local"]
+    return stats
@@ -1,36 +1,100 @@
-from langchain.memory import ConversationBufferMemory
+from langchain.memory import ConversationBufferWindowMemory
+from collections import OrderedDict
+from typing import Dict, Optional
+import hashlib
+import json
+import os
+import threading
+import time
+
+from answer_cache import answer_cache
+from faiss_index import index_size_bytes
+from bm25 import BM25Index
+from chunk_store import ChunkStore
+from chat_history import ChatHistory, HISTORY_RECENT_TURNS, format_turns
+
+# === Configuration ===
+MEMORY_BUDGET_BYTES = int(os.getenv("MEMORY_BUDGET_BYTES", 1024 ** 3))  # RAM for resident documents
+SESSION_IDLE_SECONDS = int(os.getenv("SESSION_IDLE_SECONDS", 6 * 3600))  # Idle sessions are dropped
+DEFAULT_SESSION_ID = "default"
+SESSION_DIR = os.getenv("SESSION_DIR", "sessions")  # Session -> document pointers shared by worker processes
+
+
+class DocumentState:
+    """
+    One ingested document: parsed pages, chunk store, FAISS index and BM25 index.
+
+    Documents are shared by every session that uploads the same file and are
+    identified by the content hash of the PDF.
+    """
+
+    def __init__(self, doc_id: str, document, chunks: ChunkStore, index, embeddings_model, bm25: BM25Index = None, summaries=None):
+        self.doc_id = doc_id                    # Content hash of the PDF
+        self.document = document                # ParsedDocument: per-page text and offsets
+        self.chunks = chunks                    # ChunkStore: byte ranges into the document's text buffer
+        self.index = index                      # faiss.Index; chunks.rows maps its rows to chunks
+        self.embeddings_model = embeddings_model
+        self.bm25 = bm25 or BM25Index(chunks.texts())  # Lexical index over chunks
+        self.summaries = summaries              # SummaryTree, or None until the background build finishes
+        self.size_bytes = self.estimate_size()
+        self.last_used = time.time()
+
+    @property
+    def global_text(self) -> str:
+        return self.document.text
+
+    @property
+    def page_count(self) -> int:
+        return self.document.page_count
+
+    @property
+    def uploaded_filename(self) -> str:
+        return self.document.filename
+
+    def estimate_size(self) -> int:
+        """
+        Approximate the RAM held by this document's index and text.
+
+        Returns:
+            int: Estimated size in bytes.
+        """
+        # The document and its chunk store share one text buffer
+        size = self.chunks.size_bytes() + self.document.page_spans.nbytes
+        if self.index is not None:
+            size += index_size_bytes(self.index)
+        return size + self.bm25.size_bytes()
 
 
 class SharedState:
     """
-    Global shared state to persist chat history, vectorstore, and metadata across requests.
+    Per-session state: chat history and the id of the session's active document.
 
     This class is used to maintain memory and document context throughout a session.
     """
 
-    def __init__(self):
+    def __init__(self, session_id: str = DEFAULT_SESSION_ID):
+        self.session_id = session_id
+        self.lock = threading.Lock()
+        self.last_used = time.time()
         self.reset()
 
     def reset(self):
         """
-        Reset all components of the shared state to their initial values.
+        Reset all components of the session state to their initial values.
         """
-        # === Core RAG Components ===
-        self.global_text = ""              # Full extracted PDF text
-        self.vectorstore = None            # FAISS vector store for chunk retrieval
-        self.embeddings_model = None       # Sentence-transformer model
-        self.chunks = []                   # Raw text chunks used for embeddings
+        self.doc_id = ""                   # Content hash of the active PDF
 
-        # === Metadata ===
-        self.uploaded_filename = ""        # PDF file name for page-specific queries
-        self.page_count = 0                # Total number of pages in the PDF
+        # === Agent (built lazily, reused until the document changes) ===
+        self.agent = None
+        self.agent_doc_id = ""
 
         # === Chat Memory ===
-        self.chat_history = []             # Stores past user-bot interactions
+        self.chat_history = ChatHistory()  # Recent turns verbatim + rolling summary of older ones
 
-        self.memory = ConversationBufferMemory(
+        self.memory = ConversationBufferWindowMemory(
             memory_key="chat_history",
-            return_messages=False
+            return_messages=False,
+            k=HISTORY_RECENT_TURNS
         )
 
     def add_to_history(self, user_msg: str, bot_msg: str):
@@ -45,22 +109,41 @@ class SharedState:
         self.memory.chat_memory.add_user_message(user_msg)
         self.memory.chat_memory.add_ai_message(bot_msg)
 
+        # The window memory only limits what is read; trim what is stored to match
+        messages = self.memory.chat_memory.messages
+        excess = len(messages) - 2 * self.memory.k
+        if excess > 0:
+            del messages[:excess]
+
     def print_chat_history(self):
         """
-        Print the entire conversation history to the console.
+        Print the rolling summary and recent turns to the console.
         Useful for debugging or development.
         """
-        print("\n=== Chat History ===")
+        print(f"\n=== Chat History ({self.session_id}) ===")
         if not self.chat_history:
             print("No conversation history yet.")
             return
 
-        for i, turn in enumerate(self.chat_history, 1):
+        if self.chat_history.summary:
+            print(f"Summary: {self.chat_history.summary}")
+        first = self.chat_history.total_turns - len(self.chat_history) + 1
+        for i, turn in enumerate(self.chat_history, first):
             print(f"\n--- Message {i} ---")
             print(f"User: {turn['user']}")
             print(f"Bot : {turn['bot']}")
         print("====================\n")
 
+    def print_last_turn(self):
+        """
+        Print only the most recent turn, for per-request logging.
+        """
+        if not len(self.chat_history):
+            return
+        turn = self.chat_history[-1]
+        print(f"[{self.session_id} #{self.chat_history.total_turns}] User: {turn['user']}")
+        print(f"[{self.session_id} #{self.chat_history.total_turns}] Bot : {turn['bot']}")
+
     def get_history_as_text(self, last_n: int = 30) -> str:
         """
         Return the last `n` conversation turns as a formatted string.
@@ -71,12 +154,195 @@ class SharedState:
         Returns:
             str: Formatted conversation history for prompt injection or memory context.
         """
-        history_slice = self.chat_history[-last_n:]
-        return "\n".join(
-            f"User: {turn['user']}\nAssistant: {turn['bot']}"
-            for turn in history_slice
-        )
+        return format_turns(self.chat_history[-last_n:])
+
+
+class StateRegistry:
+    """
+    Registry of sessions and resident documents for one server process.
+
+    Documents are kept in least-recently-used order; when their estimated
+    size exceeds MEMORY_BUDGET_BYTES the oldest are dropped from RAM and
+    reloaded from the on-disk cache the next time a session needs them.
+    """
+
+    def __init__(self, memory_budget: int = MEMORY_BUDGET_BYTES):
+        self.memory_budget = memory_budget
+        self._sessions: Dict[str, SharedState] = {}
+        self._documents: "OrderedDict[str, DocumentState]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get_session(self, session_id: str = DEFAULT_SESSION_ID) -> SharedState:
+        """
+        Return the session with the given id, creating it if needed.
+
+        Args:
+            session_id (str): Client-chosen session identifier.
+
+        Returns:
+            SharedState: The session state.
+        """
+        with self._lock:
+            self._prune_sessions()
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = SharedState(session_id)
+                self._sessions[session_id] = session
+            session.last_used = time.time()
+            return session
+
+    def register_document(self, doc_state: DocumentState):
+        """
+        Make an ingested document resident, evicting others if over budget.
+
+        Args:
+            doc_state (DocumentState): Fully built document.
+        """
+        with self._lock:
+            self._documents[doc_state.doc_id] = doc_state
+            self._documents.move_to_end(doc_state.doc_id)
+            self._evict(keep=doc_state.doc_id)
+
+    def get_document(self, doc_id: str) -> Optional[DocumentState]:
+        """
+        Return a document, reloading it from the on-disk cache if it was evicted.
+
+        Args:
+            doc_id (str): Content hash of the PDF.
+
+        Returns:
+            DocumentState | None: The document, or None if it is unknown.
+        """
+        if not doc_id:
+            return None
+
+        with self._lock:
+            doc_state = self._documents.get(doc_id)
+            if doc_state is not None:
+                self._documents.move_to_end(doc_id)
+                doc_state.last_used = time.time()
+                return doc_state
+
+        doc_state = self._load_from_disk(doc_id)
+        if doc_state is not None:
+            self.register_document(doc_state)
+        return doc_state
+
+    def activate(self, session_id: str, doc_id: str):
+        """
+        Point a session at a document, resetting its chat history.
+
+        Args:
+            session_id (str): Session identifier.
+            doc_id (str): Content hash of a registered document.
+        """
+        session = self.get_session(session_id)
+        with session.lock:
+            session.reset()
+            session.doc_id = doc_id
+            _write_session_pointer(session_id, doc_id)
+
+    def session_document(self, session: SharedState) -> Optional[DocumentState]:
+        """
+        Return a session's active document, following activations made by other workers.
+
+        With several worker processes, the upload and the question may land on
+        different workers; the on-disk session pointer is authoritative.
+        The caller must hold `session.lock`.
+
+        Args:
+            session (SharedState): Session being answered.
+
+        Returns:
+            DocumentState | None: The active document, or None if there is none.
+        """
+        doc_id = _read_session_pointer(session.session_id)
+        if doc_id and doc_id != session.doc_id:
+            session.reset()
+            session.doc_id = doc_id
+        return self.get_document(session.doc_id)
+
+    def remove_document(self, doc_id: str = None):
+        """
+        Forget a document entirely, including its cached answers.
+
+        Args:
+            doc_id (str, optional): Content hash of the PDF; forget every document if omitted.
+        """
+        with self._lock:
+            if doc_id is None:
+                self._documents.clear()
+            else:
+                self._documents.pop(doc_id, None)
+        answer_cache.invalidate(doc_id)
+
+    def stats(self) -> dict:
+        """
+        Report resident documents, their estimated size and session count.
+
+        Returns:
+            dict: Registry usage figures.
+        """
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "resident_documents": len(self._documents),
+                "resident_bytes": sum(d.size_bytes for d in self._documents.values()),
+                "memory_budget_bytes": self.memory_budget,
+            }
+
+    def _evict(self, keep: str = None):
+        total = sum(d.size_bytes for d in self._documents.values())
+        for doc_id in list(self._documents):
+            if total <= self.memory_budget:
+                break
+            if doc_id == keep:
+                continue
+            evicted = self._documents.pop(doc_id)
+            total -= evicted.size_bytes
+            print(f"[REGISTRY] Evicted document {doc_id[:12]} ({evicted.size_bytes} bytes) from memory")
+
+    def _prune_sessions(self):
+        cutoff = time.time() - SESSION_IDLE_SECONDS
+        for session_id in [s for s, state in self._sessions.items() if state.last_used < cutoff]:
+            del self._sessions[session_id]
+
+    @staticmethod
+    def _load_from_disk(doc_id: str) -> Optional[DocumentState]:
+        # Imported here: the cache pulls in the embedding stack
+        import document_cache
+        from embeddings import get_embeddings
+
+        embeddings_model = get_embeddings()
+        cached = document_cache.load_document(doc_id)
+        if not cached:
+            return None
+
+        print(f"[REGISTRY] Loaded document {doc_id[:12]} from disk")
+        return DocumentState(doc_id, cached["document"], cached["chunks"], cached["index"], embeddings_model, cached["bm25"], cached["summaries"])
+
+
+def _session_pointer_path(session_id: str) -> str:
+    # Session ids are client-chosen; hash them into a safe file name
+    return os.path.join(SESSION_DIR, hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:32] + ".json")
+
+
+def _write_session_pointer(session_id: str, doc_id: str):
+    os.makedirs(SESSION_DIR, exist_ok=True)
+    path = _session_pointer_path(session_id)
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"doc_id": doc_id, "updated": time.time()}, f)
+    os.replace(tmp_path, path)
+
+
+def _read_session_pointer(session_id: str) -> Optional[str]:
+    try:
+        with open(_session_pointer_path(session_id), "r", encoding="utf-8") as f:
+            return json.load(f).get("doc_id")
+    except (OSError, ValueError):
+        return None
 
 
 # === Singleton instance ===
-shared_state = SharedState()
+state_registry = StateRegistry()
@@ -1,6 +1,7 @@
 import { useState } from 'react';
 import PdfUpload from './components/PdfUpload';
 import ChatInterface from './components/ChatInterface';
+import { sessionQuery } from './session';
 
 function App() {
   const [filename, setFilename] = useState('');
@@ -11,12 +12,23 @@ function App() {
   const [chatKey, setChatKey] = useState(0);
   const [fadeOutChat, setFadeOutChat] = useState(false);
 
+  // Poll the ingestion job until the document is ready
+  const waitForJob = async (jobId) => {
+    while (true) {
+      const response = await fetch(`http://localhost:8000/jobs/${jobId}`);
+      const job = await response.json();
+      if (job.status === 'done') return job.result;
+      if (job.status === 'failed' || job.error) throw new Error(job.error || 'Processing failed');
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+  };
+
   const handleUpload = async (file) => {
     const formData = new FormData();
     formData.append('file', file);
 
     try {
-      const response = await fetch('http://localhost:8000/upload/', {
+      const response = await fetch(`http://localhost:8000/upload/?${sessionQuery}`, {
         method: 'POST',
         body: formData,
       });
@@ -24,7 +36,10 @@ function App() {
       const text = await response.text();
       if (!response.ok) throw new Error(text || 'Upload failed');
 
-      const result = JSON.parse(text);
+      const accepted = JSON.parse(text);
+      if (accepted.error) throw new Error(accepted.error);
+
+      const result = await waitForJob(accepted.job_id);
       console.log('✅ Upload success:', result);
 
       setFilename(result.filename);
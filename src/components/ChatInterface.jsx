@@ -1,4 +1,5 @@
 import { useState, useRef } from 'react';
+import { sessionQuery } from '../session';
 
 function ChatInterface({ filename, onUploadNewPdf }) {
   const [question, setQuestion] = useState('');
@@ -12,7 +13,7 @@ function ChatInterface({ filename, onUploadNewPdf }) {
 
     setLoading(true);
     try {
-      const response = await fetch('http://localhost:8000/ask/', {
+      const response = await fetch(`http://localhost:8000/ask/?${sessionQuery}`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ question }),
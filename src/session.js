@@ -0,0 +1,16 @@
+// One chat session per browser tab, so tabs and users never share a document or history
+const STORAGE_KEY = 'pdf-chatbot-session-id';
+
+const createId = () =>
+  window.crypto?.randomUUID?.() ?? `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
+export const sessionId = (() => {
+  let id = window.sessionStorage.getItem(STORAGE_KEY);
+  if (!id) {
+    id = createId();
+    window.sessionStorage.setItem(STORAGE_KEY, id);
+  }
+  return id;
+})();
+
+export const sessionQuery = `session_id=${encodeURIComponent(sessionId)}`;
@@ -0,0 +1,187 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from metrics import span
+
+# === Configuration ===
+# Off by default: a build makes one LLM call per chunk batch, page and section, and
+# priority only orders queued calls, so questions still wait behind running ones
+SUMMARIES_ENABLED = os.getenv("DOCUMENT_SUMMARIES", "0") == "1"  # Build summary trees after ingestion
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", 2))  # Parallel LLM calls within one map/reduce level
+SUMMARY_BATCH_CHARS = 6000  # Chunk text summarised per map call
+PAGES_PER_SECTION = 10      # Page summaries reduced into one section summary
+
+# One document at a time; its map/reduce calls fan out over the LLM pool
+_builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary-builder")
+_llm_pool = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summary-llm")
+_pending = set()
+_pending_lock = threading.Lock()
+
+# Summariser signature: (level, text) -> summary, where level is one of
+# "chunks", "page", "section" or "document"
+Summarize = Callable[[str, str], str]
+
+
+class SummaryTree:
+    """
+    Precomputed summaries of a document at page, section and document level.
+    """
+
+    def __init__(self, pages: Dict[int, str], sections: List[dict], document: str):
+        self.pages = pages          # Page number -> summary
+        self.sections = sections    # [{'first_page', 'last_page', 'summary'}], in page order
+        self.document = document    # Summary of the whole document
+
+    def page(self, page_num: int) -> Optional[str]:
+        """
+        Return the summary of one page.
+
+        Args:
+            page_num (int): 1-based page number.
+
+        Returns:
+            str | None: Summary, or None if the page had no text.
+        """
+        return self.pages.get(page_num)
+
+    def to_dict(self) -> dict:
+        return {
+            "pages": {str(page_num): summary for page_num, summary in self.pages.items()},
+            "sections": self.sections,
+            "document": self.document,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SummaryTree":
+        pages = {int(page_num): summary for page_num, summary in data["pages"].items()}
+        return cls(pages, data["sections"], data["document"])
+
+
+def _page_batches(chunks) -> "OrderedDict[int, List[tuple]]":
+    """
+    Group chunks into per-page byte ranges of at most SUMMARY_BATCH_CHARS.
+
+    Consecutive chunks of a page are read as one span, so overlap text is
+    summarised once.
+
+    Args:
+        chunks (ChunkStore): Chunks of the document.
+
+    Returns:
+        OrderedDict[int, List[tuple]]: Page number -> list of (start, end) byte ranges.
+    """
+    batches: "OrderedDict[int, List[tuple]]" = OrderedDict()
+    for chunk_id in sorted(range(len(chunks)), key=lambda i: int(chunks.starts[i])):
+        page_num = int(chunks.pages[chunk_id])
+        if page_num == 0:
+            continue
+        start, end = int(chunks.starts[chunk_id]), int(chunks.ends[chunk_id])
+        ranges = batches.setdefault(page_num, [])
+        if ranges and end - ranges[-1][0] <= SUMMARY_BATCH_CHARS:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+        else:
+            ranges.append((start, end))
+    return batches
+
+
+def _reduce(summarize: Summarize, level: str, parts: List[str]) -> str:
+    if len(parts) == 1:
+        return parts[0]
+    return summarize(level, "\n\n".join(parts))
+
+
+def build_summary_tree(chunks, summarize: Summarize) -> Optional[SummaryTree]:
+    """
+    Summarise a document bottom-up: chunks, then pages, then sections, then the whole.
+
+    Every level is a parallel map over the LLM pool; a level only starts once
+    the one below it has finished.
+
+    Args:
+        chunks (ChunkStore): Chunks of the document.
+        summarize (Summarize): Produces a summary of the given text at the given level.
+
+    Returns:
+        SummaryTree | None: The tree, or None if the document has no text.
+    """
+    batches = _page_batches(chunks)
+    if not batches:
+        return None
+
+    # Map: summarise chunk batches
+    jobs = [(page_num, start, end) for page_num, ranges in batches.items() for start, end in ranges]
+    with span("summary_chunks"):
+        chunk_summaries = list(_llm_pool.map(
+            lambda job: summarize("chunks", chunks.span_text(job[1], job[2])), jobs
+        ))
+
+    by_page: "OrderedDict[int, List[str]]" = OrderedDict()
+    for (page_num, _, _), summary in zip(jobs, chunk_summaries):
+        by_page.setdefault(page_num, []).append(summary.strip())
+
+    # Reduce: pages, then fixed-size runs of pages, then the document
+    with span("summary_pages"):
+        page_nums = list(by_page)
+        page_summaries = list(_llm_pool.map(
+            lambda page_num: _reduce(summarize, "page", by_page[page_num]).strip(), page_nums
+        ))
+    pages = dict(zip(page_nums, page_summaries))
+
+    groups = [page_nums[i:i + PAGES_PER_SECTION] for i in range(0, len(page_nums), PAGES_PER_SECTION)]
+    with span("summary_sections"):
+        section_summaries = list(_llm_pool.map(
+            lambda group: _reduce(summarize, "section", [f"Page {n}: {pages[n]}" for n in group]).strip(),
+            groups,
+        ))
+    sections = [
+        {"first_page": group[0], "last_page": group[-1], "summary": summary}
+        for group, summary in zip(groups, section_summaries)
+    ]
+
+    with span("summary_document"):
+        document = _reduce(summarize, "document", section_summaries).strip()
+
+    return SummaryTree(pages, sections, document)
+
+
+def schedule_summaries(doc_state, summarize: Summarize):
+    """
+    Build a document's summary tree in the background and store it with the document.
+
+    Does nothing if summaries are disabled, the document already has a tree,
+    or a build for it is already queued.
+
+    Args:
+        doc_state (DocumentState): Ingested document.
+        summarize (Summarize): Produces a summary of the given text at the given level.
+    """
+    if not SUMMARIES_ENABLED or doc_state.summaries is not None:
+        return
+    with _pending_lock:
+        if doc_state.doc_id in _pending:
+            return
+        _pending.add(doc_state.doc_id)
+    _builder.submit(_build, doc_state, summarize)
+
+
+def _build(doc_state, summarize: Summarize):
+    # Imported here: document_cache imports this module for SummaryTree
+    import document_cache
+
+    doc_id = doc_state.doc_id
+    try:
+        with span("summary_build"):
+            tree = build_summary_tree(doc_state.chunks, summarize)
+        if tree is None:
+            return
+        doc_state.summaries = tree
+        document_cache.save_summaries(doc_id, tree.to_dict())
+        print(f"[SUMMARY] Built summary tree for {doc_id[:12]} ({len(tree.pages)} pages, {len(tree.sections)} sections)")
+    except Exception as e:
+        print(f"[SUMMARY] Failed for {doc_id[:12]}: {e}")
+    finally:
+        with _pending_lock:
+            _pending.discard(doc_id)
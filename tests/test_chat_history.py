@@ -0,0 +1,37 @@
+import chat_history
+from chat_history import ChatHistory, COMPACTION_BATCH_TURNS, HISTORY_RECENT_TURNS
+
+
+def _drain():
+    # The compactor is a single worker; a no-op queued behind it waits for pending work
+    chat_history._compactor.submit(lambda: None).result()
+
+
+def test_compaction_runs_once_per_batch_of_evicted_turns():
+    history = ChatHistory()
+    batches = []
+
+    def summarize(previous, turns):
+        batches.append(len(turns))
+        return f"{previous} +{len(turns)}"
+
+    for i in range(30):
+        history.append({"user": f"q{i}", "bot": f"a{i}"})
+        history.schedule_compaction(summarize)
+        _drain()
+
+    evicted = 30 - HISTORY_RECENT_TURNS
+    assert len(batches) == evicted // COMPACTION_BATCH_TURNS
+    assert all(size == COMPACTION_BATCH_TURNS for size in batches)
+
+
+def test_pending_turns_stay_visible_until_summarised():
+    history = ChatHistory()
+    for i in range(HISTORY_RECENT_TURNS + 2):
+        history.append({"user": f"q{i}", "bot": f"a{i}"})
+    history.schedule_compaction(lambda previous, turns: "unused")
+    _drain()
+
+    rendered = history.render(token_budget=10_000)
+    assert "User: q0" in rendered
+    assert history.summary == ""
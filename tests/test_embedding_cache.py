@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import embedding_cache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "CACHE_PATH", str(tmp_path / "embeddings.sqlite3"))
+    yield embedding_cache
+    embedding_cache._reset()
+
+
+def _vectors(start, count):
+    return {f"key-{i}": np.full(4, i, dtype=np.float32) for i in range(start, start + count)}
+
+
+def test_round_trip(cache):
+    cache.put_many(_vectors(0, 3))
+    found = cache.get_many(["key-0", "key-2", "missing"])
+    assert sorted(found) == ["key-0", "key-2"]
+    assert np.array_equal(found["key-2"], np.full(4, 2, dtype=np.float32))
+
+
+def test_connection_and_schema_reused_per_thread(cache, monkeypatch):
+    setups = []
+    setup = cache._setup
+    monkeypatch.setattr(cache, "_setup", lambda path: setups.append(path) or setup(path))
+
+    cache.put_many(_vectors(0, 2))
+    conn = cache._local.conn
+    cache.get_many(["key-0"])
+    cache.put_many(_vectors(2, 2))
+
+    assert cache._local.conn is conn
+    assert setups == [cache.CACHE_PATH]
+
+
+def test_row_count_tracked_and_trimmed(cache, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_MAX_ROWS", 10)
+    cache.put_many(_vectors(0, 5))
+    cache.put_many(_vectors(0, 5))  # Existing keys are not counted twice
+    assert cache._row_counts[cache.CACHE_PATH] == 5
+
+    for start in range(5, 40, 5):
+        cache.put_many(_vectors(start, 5))
+    (rows,) = cache._local.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+    assert rows <= 10
+    assert cache._row_counts[cache.CACHE_PATH] == rows
+    assert "key-39" in cache.get_many(["key-39"])
@@ -0,0 +1,36 @@
+import os
+
+import numpy as np
+import pytest
+
+from faiss_index import build_index, load_index, save_index
+
+DIM = 384
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(2000, DIM)).astype("float32")
+
+
+def _mapped(path: str) -> bool:
+    with open("/proc/self/maps") as f:
+        return os.path.realpath(path) in f.read()
+
+
+@pytest.mark.parametrize("mode", ["flat", "hnsw", "ivfpq"])
+def test_load_index_memory_maps_every_mode(mode, vectors, tmp_path, capsys):
+    index = build_index(vectors, mode)
+    path = str(tmp_path / f"{mode}.faiss")
+    save_index(index, path)
+    capsys.readouterr()
+
+    loaded = load_index(path)
+
+    assert "Could not memory-map" not in capsys.readouterr().out
+    if os.path.exists("/proc/self/maps"):
+        assert _mapped(path)
+    _, expected = index.search(vectors[:5], 5)
+    _, found = loaded.search(vectors[:5], 5)
+    np.testing.assert_array_equal(found, expected)
@@ -0,0 +1,53 @@
+import pytest
+
+import embedding_cache
+import jobs
+from embeddings import embed_chunks, iter_chunks
+from jobs import Job, STAGES
+
+PAGES = 6
+PAGE_TEXT = "Every page carries enough words to be split into several chunks. " * 40
+
+
+class FakeEmbeddings:
+    model_name = "fake"
+
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0, 0.0, 0.0] for text in texts]
+
+
+@pytest.fixture
+def job(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_DIR", str(tmp_path))
+    monkeypatch.setattr(embedding_cache, "CACHE_PATH", "")
+    return Job("doc.pdf")
+
+
+def test_progress_keeps_page_and_chunk_counters_apart(job):
+    snapshots = []
+
+    def progress(stage, done=None, total=None):
+        job.progress(stage, done, total)
+        snapshots.append(job.to_dict())
+
+    def pages():
+        for page_number in range(1, PAGES + 1):
+            progress("extract", page_number, PAGES)
+            yield page_number, PAGE_TEXT
+
+    chunks, _ = embed_chunks(iter_chunks(pages(), progress), FakeEmbeddings(), progress)
+
+    # The stage only moves forward although extraction, chunking and embedding interleave
+    stage_order = [STAGES.index(snapshot["stage"]) for snapshot in snapshots]
+    assert stage_order == sorted(stage_order)
+    assert snapshots[-1]["stage"] == "embed"
+
+    # Page counters count pages, never chunks
+    pages_done = [snapshot["pages_done"] for snapshot in snapshots]
+    assert pages_done == sorted(pages_done)
+    assert pages_done[-1] == PAGES
+    assert {snapshot["pages_total"] for snapshot in snapshots} == {PAGES}
+
+    # Chunks are counted separately; embedded never runs ahead of produced
+    assert all(snapshot["chunks_done"] <= snapshot["chunks_total"] for snapshot in snapshots)
+    assert snapshots[-1]["chunks_done"] == snapshots[-1]["chunks_total"] == len(chunks) > PAGES
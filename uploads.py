@@ -0,0 +1,187 @@
+import os
+import tempfile
+from typing import Optional, Tuple
+
+from starlette.requests import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+import document_cache
+
+# === Configuration ===
+UPLOAD_DIR = "uploads"
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 100 * 1024 ** 2))  # 100 MB
+MULTIPART_OVERHEAD_BYTES = 64 * 1024  # Allowance for boundaries and part headers in Content-Length
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES."""
+
+
+class InvalidUpload(Exception):
+    """Raised when the request carries no acceptable file part."""
+
+
+def _too_large(max_bytes: int) -> UploadTooLarge:
+    return UploadTooLarge(f"File is larger than the {max_bytes // 1024 ** 2} MB limit.")
+
+
+class _FilePart:
+    """
+    Write one uploaded file to a temporary file, hashing it in the same pass.
+    """
+
+    def __init__(self, max_bytes: int):
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=".part")
+        self.file = os.fdopen(fd, "wb")
+        self.hasher = document_cache.new_hasher()
+        self.size = 0
+        self.max_bytes = max_bytes
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise _too_large(self.max_bytes)
+        self.hasher.update(data)
+        self.file.write(data)
+
+    def commit(self) -> Tuple[str, str, int]:
+        """
+        Move the file to its content-addressed path.
+
+        Returns:
+            Tuple[str, str, int]: Stored path, content hash and size in bytes.
+        """
+        self.file.close()
+        doc_hash = self.hasher.hexdigest()
+        file_path = os.path.join(UPLOAD_DIR, f"{doc_hash}.pdf")
+        if os.path.exists(file_path):
+            os.remove(self.temp_path)  # Same content already stored
+        else:
+            os.replace(self.temp_path, file_path)
+        return file_path, doc_hash, self.size
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class _UploadReceiver:
+    """
+    Multipart parser callbacks that stream one named file field to disk.
+
+    Other fields are skipped without being buffered.
+    """
+
+    def __init__(self, field: str, suffix: str, max_bytes: int):
+        self.field = field.encode("utf-8")
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.part: Optional[_FilePart] = None  # The file field, once its headers are read
+        self.filename: Optional[str] = None
+        self._current: Optional[_FilePart] = None  # Receives data of the part being parsed
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._current = None
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if options.get(b"name") != self.field or b"filename" not in options or self.part is not None:
+            return
+        filename = options[b"filename"].decode("utf-8", errors="replace")
+        if not filename.lower().endswith(self.suffix):
+            raise InvalidUpload(f"Only {self.suffix.lstrip('.').upper()} files are allowed.")
+        self.filename = filename
+        self.part = self._current = _FilePart(self.max_bytes)
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._current is not None:
+            self._current.write(data[start:end])
+
+    def on_part_end(self):
+        self._current = None
+
+
+async def store_upload(
+    request: Request,
+    field: str = "file",
+    suffix: str = ".pdf",
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> Tuple[str, str, int, str]:
+    """
+    Stream a multipart upload straight to disk, hashing it in the same pass.
+
+    The request body is parsed as it arrives, so the file is written once and
+    memory use stays at one network chunk regardless of file size. A declared
+    Content-Length over the limit is rejected before any of the body is read.
+    The file is stored under its content hash, so concurrent uploads that
+    share a filename never overwrite each other and identical uploads are
+    kept once.
+
+    Args:
+        request (Request): Incoming multipart/form-data request.
+        field (str): Form field holding the file.
+        suffix (str): Required filename extension.
+        max_bytes (int): Largest accepted file.
+
+    Returns:
+        Tuple[str, str, int, str]: Stored path, content hash, size in bytes and original filename.
+
+    Raises:
+        UploadTooLarge: If the upload is larger than `max_bytes`.
+        InvalidUpload: If the request is not multipart or has no acceptable file in `field`.
+    """
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise _too_large(max_bytes)
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise InvalidUpload("Expected a multipart/form-data upload.")
+
+    receiver = _UploadReceiver(field, suffix, max_bytes)
+    parser = MultipartParser(boundary, receiver.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+        if receiver.part is None:
+            raise InvalidUpload(f"No '{field}' file in the upload.")
+        file_path, doc_hash, size = receiver.part.commit()
+        return file_path, doc_hash, size, receiver.filename
+    except BaseException:
+        if receiver.part is not None:
+            receiver.part.discard()
+        raise